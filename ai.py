@@ -1,26 +1,203 @@
+import collections
+import concurrent.futures
 import random
 import math
 import time
 import settings
-import sounds
+from pathfinding import FlowFields, create_pathfinder
+from spatial import SpatialIndex
+
+def get_squad_visible_tiles(game, squad, ai_state):
+    """
+    Returns the tiles a squad can see, cached in its AI state.
+    The cache is keyed on each member's position, posture and alive flag, so it is
+    only recomputed when one of them has changed since the last call.
+    """
+    key = tuple((u.x, u.y, u.posture, u.is_alive) for u in squad)
+    if ai_state['vision_key'] == key:
+        game.ai_vision_cache_stats['hits'] += 1
+    else:
+        game.ai_vision_cache_stats['misses'] += 1
+        ai_state['vision_key'] = key
+        ai_state['visible_tiles'] = game.game_map.calculate_visible_tiles(squad)
+    return ai_state['visible_tiles']
+
+def new_squad_state():
+    """Returns the AI state of a squad that has seen nothing yet."""
+    return {'target': None, 'last_known_pos': None, 'search_pos': None, 'vision_key': None, 'visible_tiles': set()}
+
+class PlanUnit:
+    """A copy of the unit state the AI reads, which a plan can change without touching the game."""
+    __slots__ = ('source', 'x', 'y', 'team', 'hp', 'ap', 'posture', 'is_alive', 'distance_travelled', 'unit_index')
+    def __init__(self, unit, unit_index):
+        self.source = unit
+        self.x, self.y = unit.x, unit.y
+        self.team, self.hp, self.ap, self.posture, self.is_alive = unit.team, unit.hp, unit.ap, unit.posture, unit.is_alive
+        self.distance_travelled = unit.distance_travelled
+        self.unit_index = unit_index
+        unit_index.add(self)
+
+    def set_position(self, x, y):
+        self.unit_index.move(self, x, y)
+
+class PlanningGame:
+    """
+    Stands in for the game while the enemy turn is planned on a snapshot of it.
+    Attacks are recorded rather than resolved, moves make no sound, and reaction fire is left to the real game.
+    """
+    def __init__(self, game, flow_fields):
+        self.game_map = game.game_map # Only its walls and cover are read, which never change
+        self.flow_fields = flow_fields
+        self.ai_rng = random.Random()
+        self.ai_rng.setstate(game.ai_rng.getstate())
+        self.ai_vision_cache_stats = game.ai_vision_cache_stats
+        self.unit_index = SpatialIndex()
+        self.units = {unit: PlanUnit(unit, self.unit_index) for unit in game.player_squad + game.all_enemies}
+        self.player_squad = [self.units[unit] for unit in game.player_squad]
+        self.enemy_squads = [[self.units[unit] for unit in squad] for squad in game.enemy_squads]
+        self.all_enemies = [unit for squad in self.enemy_squads for unit in squad]
+        self.squad_ai_states = [dict(state, target=state['target'] and self.units[state['target']]) for state in game.squad_ai_states]
+        self.attack = None
+        self.reaction_checks = []
+
+    def handle_reaction_fire(self, acting_unit):
+        self.reaction_checks.append((acting_unit.source, self.ai_snapshot()))
+        return False
+
+    def handle_move(self, unit, x, y):
+        unit.set_position(x, y)
+        unit.ap -= settings.MOVE_COST
+        unit.distance_travelled += 2
+
+    def handle_ranged_attack(self, attacker, target):
+        attacker.ap -= settings.SHOOT_COST
+        self.attack = ('ranged', target.source)
+
+    def handle_melee_attack(self, attacker, target):
+        attacker.ap -= settings.MELEE_COST
+        self.attack = ('melee', target.source)
+
+    def ai_snapshot(self):
+        """Returns the squad AI states, with targets as game units, and the AI random state, for the game to take on."""
+        states = [dict(state, target=state['target'] and state['target'].source) for state in self.squad_ai_states]
+        return states, self.ai_rng.getstate()
+
+# One call of run_squads_ai: kind is 'move' (argument the tile), 'melee' or 'ranged' (argument the target),
+# or 'end' once no enemy can act. reaction_checks are the units it checked for reaction fire, in order, each
+# with the AI snapshot at that point, since a kill ends the call there. ai_snapshot is the one after the call.
+PlannedAction = collections.namedtuple('PlannedAction', 'unit kind argument reaction_checks ai_snapshot')
+
+def plan_enemy_turn(planning_game):
+    """Runs the enemy AI on a PlanningGame until no enemy can act. Returns the PlannedActions in order, ending with an 'end' action."""
+    actions = []
+    while True:
+        planning_game.attack = None
+        planning_game.reaction_checks = []
+        unit = run_squads_ai(planning_game, planning_game.enemy_squads, planning_game.squad_ai_states, planning_game.player_squad)
+        if not unit:
+            actions.append(PlannedAction(None, 'end', None, planning_game.reaction_checks, planning_game.ai_snapshot()))
+            return actions
+        kind, argument = planning_game.attack or ('move', (unit.x, unit.y))
+        actions.append(PlannedAction(unit.source, kind, argument, planning_game.reaction_checks, planning_game.ai_snapshot()))
+
+class AIPlanner:
+    """
+    Plans enemy turns on a worker thread. The main thread hands it a PlanningGame snapshot and applies the
+    finished plan an action at a time, so the worker never reads or writes live game state.
+    """
+    def __init__(self, game_map, threaded=True):
+        self.flow_fields = FlowFields(create_pathfinder(game_map)) # Used only by the worker
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1) if threaded else None
+        self.plan = collections.deque()
+        self.pending = None
+
+    def next_action(self, game):
+        """Returns the next planned action, starting a plan from the game's current state if there is none. None while planning."""
+        if not self.plan:
+            if self.pending is None:
+                planning_game = PlanningGame(game, self.flow_fields)
+                if self.executor is None:
+                    self.plan.extend(plan_enemy_turn(planning_game))
+                    return self.plan.popleft()
+                self.pending = self.executor.submit(plan_enemy_turn, planning_game)
+            if not self.pending.done(): return None
+            self.plan.extend(self.pending.result())
+            self.pending = None
+        return self.plan.popleft()
+
+    def discard_plan(self):
+        """Drops the rest of the plan after the game diverged from it, so the next action is replanned."""
+        self.plan.clear()
+
+def take_ai_snapshot(game, ai_snapshot):
+    """Sets the game's squad AI states and AI random state to those in a PlanningGame.ai_snapshot()."""
+    states, rng_state = ai_snapshot
+    for state, planned_state in zip(game.squad_ai_states, states):
+        state.update(planned_state)
+    game.ai_rng.setstate(rng_state)
+
+def apply_planned_action(game, action):
+    """
+    Carries out a planned action in the game, as run_squads_ai would have, with reaction fire resolved for real.
+    Returns False if the game no longer matches the plan and it must be made again.
+    """
+    unit, kind, argument = action.unit, action.kind, action.argument
+    if unit and (not unit.is_alive or unit.ap <= 0): return False
+    hp_before = [u.hp for u in game.player_squad + game.all_enemies]
+    for checked_unit, ai_snapshot in action.reaction_checks:
+        if game.handle_reaction_fire(checked_unit):
+            take_ai_snapshot(game, ai_snapshot) # A kill ends the action here, as it does in run_squads_ai
+            return False
+    take_ai_snapshot(game, action.ai_snapshot)
+    if kind == 'end':
+        game.end_enemy_turn()
+    elif kind == 'melee':
+        game.handle_melee_attack(unit, argument)
+    elif kind == 'ranged':
+        game.handle_ranged_attack(unit, argument)
+    else:
+        game.handle_move(unit, *argument)
+    return hp_before == [u.hp for u in game.player_squad + game.all_enemies]
 
 def run_enemy_ai(game):
     """
-    Runs the AI for all enemy squads for one turn.
-    The AI will attempt one action per frame to keep the game responsive.
+    Runs one frame of the enemy turn without blocking the main loop. The turn is planned by game.ai_planner,
+    and its actions are applied back to back for up to settings.AI_FRAME_BUDGET_MS. After an action the
+    player can see, the AI waits AI_VISIBLE_ACTION_DELAY_MS so it can be followed on screen.
+    Any hit, e.g. from reaction fire, changes what the AI would do, so the rest of the turn is then replanned.
+    """
+    now = time.perf_counter()
+    if now < game.ai_resume_time: return
+    deadline = now + settings.AI_FRAME_BUDGET_MS / 1000
+    while game.game_state == 'ENEMY_TURN':
+        action = game.ai_planner.next_action(game)
+        if action is None: return
+        unit = action.unit
+        messages_before = len(game.skill_check_messages)
+        if not apply_planned_action(game, action):
+            game.ai_planner.discard_plan()
+        if unit is None: return
+        if game.game_map.is_visible[unit.x, unit.y] or len(game.skill_check_messages) > messages_before:
+            game.ai_resume_time = time.perf_counter() + settings.AI_VISIBLE_ACTION_DELAY_MS / 1000
+            return
+        if time.perf_counter() >= deadline: return
+
+def run_squads_ai(game, squads, ai_states, opponents):
+    """
+    Lets one unit from the first of squads that can still act take one action against opponents.
+    ai_states holds the state of each squad. Returns the unit that acted, or None once none of the squads can act.
     """
-    time.sleep(0.1)
-    acted_this_frame = False
+    acted_this_frame = None
     
-    for i, squad in enumerate(game.enemy_squads):
+    for i, squad in enumerate(squads):
         if acted_this_frame:
             break
 
-        ai_state = game.squad_ai_states[i]
+        ai_state = ai_states[i]
         
         # Update squad intelligence based on what they can see
-        squad_visible_tiles = game.game_map.calculate_visible_tiles(squad)
-        visible_players = [p for p in game.player_squad if p.is_alive and (p.x, p.y) in squad_visible_tiles]
+        squad_visible_tiles = get_squad_visible_tiles(game, squad, ai_state)
+        visible_players = [p for p in opponents if p.is_alive and (p.x, p.y) in squad_visible_tiles]
         
         if visible_players:
             ai_state['target'] = min(visible_players, key=lambda p: p.hp)
@@ -39,8 +216,8 @@ def run_enemy_ai(game):
             if ai_state['search_pos'] is None or all(math.dist((u.x, u.y), ai_state['search_pos']) < 3 for u in squad if u.is_alive):
                 # Find a new random point that isn't cover
                 while True:
-                    potential_dest = random.choice(game.game_map.spawn_points)
-                    if not game.game_map.tiles[potential_dest[0]][potential_dest[1]].is_cover:
+                    potential_dest = game.ai_rng.choice(game.game_map.spawn_points)
+                    if not game.game_map.is_cover[potential_dest]:
                         ai_state['search_pos'] = potential_dest
                         break
             destination = ai_state['search_pos']
@@ -51,33 +228,29 @@ def run_enemy_ai(game):
                 
                 killed_by_overwatch = game.handle_reaction_fire(unit)
                 if killed_by_overwatch:
-                    acted_this_frame = True
+                    acted_this_frame = unit
                     break
 
                 # 1. Melee attack if possible
                 if ai_state['target'] and math.dist((unit.x, unit.y), (ai_state['target'].x, ai_state['target'].y)) < 1.5 and unit.ap >= settings.MELEE_COST:
                     game.handle_melee_attack(unit, ai_state['target'])
-                    acted_this_frame = True
+                    acted_this_frame = unit
                     break
                 # 2. Ranged attack if possible
                 elif ai_state['target'] and unit.ap >= settings.SHOOT_COST:
                     game.handle_ranged_attack(unit, ai_state['target'])
-                    acted_this_frame = True
+                    acted_this_frame = unit
                     break
                 # 3. Move towards destination
                 elif destination and unit.ap >= settings.MOVE_COST:
                     if ai_state['last_known_pos'] and (unit.x, unit.y) == ai_state['last_known_pos']:
                         ai_state['last_known_pos'] = None
                     
-                    occupied_nodes = { (u.x, u.y) for u in game.player_squad + game.all_enemies if u is not unit }
-                    path = game.astar.find_path((unit.x, unit.y), destination, occupied_nodes)
-                    if path and len(path) > 1:
-                        unit.x, unit.y = path[1]
-                        unit.ap -= settings.MOVE_COST
-                        sounds.SOUNDS['move'].play()
-                        acted_this_frame = True
+                    # The unit's own tile is never a step, so it needn't be left out of the occupied tiles
+                    next_pos = game.flow_fields.next_step((unit.x, unit.y), destination, game.unit_index.tiles, game.unit_index.version)
+                    if next_pos:
+                        game.handle_move(unit, *next_pos)
+                        acted_this_frame = unit
                         break
-    
-    # --- FIX: Call the correct function to end the enemy turn ---
-    if not acted_this_frame:
-        game.end_enemy_turn()
+
+    return acted_this_frame
@@ -0,0 +1,118 @@
+import argparse
+import ast
+import multiprocessing
+import os
+import time
+import numpy
+import settings
+import sounds
+from engine import Engine
+
+TEAMS = ['player', 'enemy']
+WINNERS = [None, 'player', 'enemy'] # Index 0 is a draw
+UNIT_STATS = ['shots_taken', 'shots_hit', 'kills', 'heals_given', 'distance_travelled', 'hp']
+
+def apply_overrides(overrides):
+    """Sets each NAME=value pair in overrides on the settings module."""
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    sounds.enabled = False
+
+def play_match(seed):
+    """Plays one headless AI-vs-AI match. Returns (seed, winner index, turns played, per-unit rows)."""
+    engine = Engine(seed)
+    winner = engine.run_match()
+    units = [(TEAMS.index(unit.team), unit.is_alive) + tuple(getattr(unit, stat) for stat in UNIT_STATS)
+             for unit in engine.player_squad + engine.all_enemies]
+    turns = min(engine.turn_number, settings.MATCH_MAX_TURNS) # A draw stops after the last allowed turn
+    return seed, WINNERS.index(winner), turns, units
+
+def run_batch(seeds, overrides, processes=None):
+    """
+    Plays a match for each seed across a process pool, with overrides applied to settings in every worker.
+    Returns the results as columns: per-match arrays, plus per-unit arrays indexed back to their match.
+    """
+    with multiprocessing.Pool(processes, initializer=apply_overrides, initargs=(overrides,)) as pool:
+        results = sorted(pool.imap_unordered(play_match, seeds))
+    unit_rows = [(match,) + row for match, result in enumerate(results) for row in result[3]]
+    unit_columns = numpy.array(unit_rows, dtype=numpy.float64).reshape(-1, 3 + len(UNIT_STATS)).T
+    columns = {
+        'seed': numpy.array([r[0] for r in results], dtype=numpy.int64),
+        'winner': numpy.array([r[1] for r in results], dtype=numpy.int8),
+        'turns': numpy.array([r[2] for r in results], dtype=numpy.int16),
+        'unit_match': unit_columns[0].astype(numpy.int32),
+        'unit_team': unit_columns[1].astype(numpy.int8),
+        'unit_alive': unit_columns[2].astype(bool),
+    }
+    for i, stat in enumerate(UNIT_STATS):
+        columns['unit_' + stat] = unit_columns[3 + i].astype(numpy.int16)
+    return columns
+
+def load_results(path, overrides):
+    """Returns the columns saved at path if they were played with the same overrides, else None."""
+    if not os.path.exists(path): return None
+    with numpy.load(path) as saved:
+        if sorted(saved['overrides'].tolist()) != sorted(describe_overrides(overrides)): return None
+        return {name: saved[name] for name in saved.files if name != 'overrides'}
+
+def merge_results(old, new):
+    """Appends the matches in new to those in old, renumbering new's unit rows."""
+    new = dict(new, unit_match=new['unit_match'] + len(old['seed']))
+    return {name: numpy.concatenate([old[name], new[name]]) for name in old}
+
+def describe_overrides(overrides):
+    return [f"{name}={value!r}" for name, value in overrides.items()]
+
+def print_report(columns):
+    num_matches = len(columns['seed'])
+    print(f"{num_matches} matches")
+    for i, name in enumerate(['draw', 'player win', 'enemy win']):
+        print(f"  {name:<11}{numpy.count_nonzero(columns['winner'] == i) / num_matches:>8.1%}")
+    turns = columns['turns']
+    print(f"turns: mean {turns.mean():.1f}, median {numpy.median(turns):.0f}, min {turns.min()}, max {turns.max()}")
+    print(f"{'per unit':<24}{'mean':>8}{'p10':>8}{'p50':>8}{'p90':>8}")
+    for team_index, team in enumerate(TEAMS):
+        on_team = columns['unit_team'] == team_index
+        print(f"  {team} (survival {columns['unit_alive'][on_team].mean():.1%})")
+        for stat in UNIT_STATS:
+            values = columns['unit_' + stat][on_team]
+            p10, p50, p90 = numpy.percentile(values, [10, 50, 90])
+            print(f"    {stat:<20}{values.mean():>8.2f}{p10:>8.1f}{p50:>8.1f}{p90:>8.1f}")
+
+def parse_override(text):
+    """Parses NAME=value, where value is a Python literal and NAME an existing setting."""
+    name, sep, value = text.partition('=')
+    if not sep or not hasattr(settings, name):
+        raise argparse.ArgumentTypeError(f"expected NAME=value for an existing setting, got {text!r}")
+    try:
+        return name, ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        raise argparse.ArgumentTypeError(f"{value!r} is not a Python literal")
+
+def main():
+    parser = argparse.ArgumentParser(description="Play seeded headless AI-vs-AI matches across all cores and report balance statistics.")
+    parser.add_argument('--matches', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=1, help="Seed of the first match; the rest follow on")
+    parser.add_argument('--processes', type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument('--set', type=parse_override, action='append', default=[], metavar='NAME=VALUE',
+                        help="Override a setting in every match, e.g. --set ENEMY_RANGED_SKILL=3")
+    parser.add_argument('--output', default='batch_results.npz', help="Columnar results file")
+    parser.add_argument('--resume', action='store_true',
+                        help="Keep the matches already in --output if they used the same overrides, and only play the missing seeds")
+    args = parser.parse_args()
+
+    overrides = dict(args.set)
+    seeds = range(args.seed, args.seed + args.matches)
+    previous = load_results(args.output, overrides) if args.resume else None
+    if previous is not None:
+        seeds = sorted(set(seeds) - set(previous['seed'].tolist())) # A seed always replays the same match
+        print(f"Reusing {len(previous['seed'])} matches from {args.output}, playing {len(seeds)}")
+    start_time = time.perf_counter()
+    columns = run_batch(seeds, overrides, args.processes)
+    if previous is not None: columns = merge_results(previous, columns)
+    print_report(columns)
+    print(f"{time.perf_counter() - start_time:.1f}s, results written to {args.output}")
+    numpy.savez_compressed(args.output, overrides=numpy.array(describe_overrides(overrides), dtype=str), **columns)
+
+if __name__ == '__main__':
+    main()
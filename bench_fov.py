@@ -0,0 +1,65 @@
+import argparse
+import collections
+import math
+import random
+import time
+import settings
+from map import GameMap
+
+Viewpoint = collections.namedtuple('Viewpoint', 'x y posture') # Stands in for a unit, as get_line_of_sight only reads these
+
+def clear_shot_tiles(game_map, viewpoint):
+    """Returns the tiles within vision range that get_line_of_sight, ignoring units, finds a clear shot at."""
+    radius = settings.UNIT_VISION_RADIUS
+    tiles = set()
+    for x in range(viewpoint.x - radius, viewpoint.x + radius + 1):
+        for y in range(viewpoint.y - radius, viewpoint.y + radius + 1):
+            if game_map.is_in_bounds(x, y) and math.dist((viewpoint.x, viewpoint.y), (x, y)) <= radius:
+                line = game_map.get_line_of_sight(viewpoint, (x, y), units_block=False)
+                if line and line[-1] == (x, y):
+                    tiles.add((x, y))
+    return tiles
+
+def run_comparison(num_maps, viewpoints_per_map, seed):
+    """
+    Works out the field of view from random floor tiles, standing and prone, with both FOV engines.
+    Checks that raycasting sees every tile that can be shot at, and returns the totals for each engine: seconds,
+    floor or cover tiles seen that can't be shot at (extra) and tiles that can be shot at but aren't seen (missed).
+    """
+    random.seed(seed)
+    totals = {'raycast': [0.0, 0, 0], 'shadowcast': [0.0, 0, 0]}
+    for _ in range(num_maps):
+        game_map = GameMap(settings.MAP_WIDTH, settings.MAP_HEIGHT)
+        engines = {'raycast': game_map._raycast_visible_tiles, 'shadowcast': game_map._shadowcast_visible_tiles}
+        floor_tiles = [(x, y) for x in range(game_map.width) for y in range(game_map.height)
+                       if not game_map.is_wall[x, y] and not game_map.is_cover[x, y]]
+        for x, y in random.sample(floor_tiles, viewpoints_per_map):
+            for posture in ('standing', 'prone'):
+                viewpoint = Viewpoint(x, y, posture)
+                shots = clear_shot_tiles(game_map, viewpoint)
+                for name, engine in engines.items():
+                    start_time = time.perf_counter()
+                    seen = engine(viewpoint)
+                    totals[name][0] += time.perf_counter() - start_time
+                    totals[name][1] += sum(1 for tile in seen - shots - {(x, y)} if not game_map.is_wall[tile])
+                    totals[name][2] += len(shots - seen)
+                if shots - engines['raycast'](viewpoint):
+                    raise AssertionError(f"Raycasting misses tiles with a clear shot from {viewpoint}")
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the raycasting and shadowcasting FOV engines against line of sight.")
+    parser.add_argument('--maps', type=int, default=20)
+    parser.add_argument('--viewpoints', type=int, default=10, help="Random floor tiles per map, each seen from standing and prone")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    totals = run_comparison(args.maps, args.viewpoints, args.seed)
+    num_views = args.maps * args.viewpoints * 2
+    print(f"{num_views} views on {args.maps} maps of {settings.MAP_WIDTH}x{settings.MAP_HEIGHT}, raycasting sees every tile with a clear shot")
+    print(f"{'':12}{'extra tiles':>13}{'missed tiles':>14}{'ms per view':>13}")
+    for name, (seconds, extra, missed) in totals.items():
+        print(f"{name:12}{extra:>13}{missed:>14}{seconds * 1000 / num_views:>13.3f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import argparse
+import random
+import time
+import settings
+from map import GameMap
+from pathfinding import AStar, FlowFields, JumpPointSearch
+
+def run_benchmark(num_maps, queries_per_map, seed):
+    """
+    Runs the same random queries through AStar and JumpPointSearch on freshly generated maps.
+    Checks that both find paths of the same length and returns the totals for each.
+    """
+    random.seed(seed)
+    totals = {'A*': [0, 0.0], 'JPS': [0, 0.0]} # nodes expanded, seconds
+    for _ in range(num_maps):
+        game_map = GameMap(settings.MAP_WIDTH, settings.MAP_HEIGHT)
+        pathfinders = {'A*': AStar(game_map), 'JPS': JumpPointSearch(game_map)}
+        floor_tiles = [(x, y) for x in range(game_map.width) for y in range(game_map.height)
+                       if not game_map.is_wall[x, y] and not game_map.is_cover[x, y]]
+        for _ in range(queries_per_map):
+            start, end = random.sample(floor_tiles, 2)
+            path_lengths = set()
+            for name, pathfinder in pathfinders.items():
+                start_time = time.perf_counter()
+                path = pathfinder.find_path(start, end)
+                totals[name][1] += time.perf_counter() - start_time
+                totals[name][0] += pathfinder.nodes_expanded
+                path_lengths.add(len(path))
+            if len(path_lengths) != 1:
+                raise AssertionError(f"Path lengths differ from {start} to {end}: {path_lengths}")
+    return totals
+
+def check_flow_field_walks(num_maps, walks_per_map, seed, num_blockers=30):
+    """
+    Walks units to their destinations one FlowFields.next_step at a time, with random tiles occupied.
+    Checks that every walk arrives in as many steps as A* around the occupied tiles takes, so a unit
+    never doubles back, and that a unit walled in gets no step, also when it asks again and the answer
+    is cached. Returns the number of walks.
+    """
+    random.seed(seed)
+    walks = 0
+    occupancy_version = 0
+    for _ in range(num_maps):
+        game_map = GameMap(settings.MAP_WIDTH, settings.MAP_HEIGHT)
+        astar = AStar(game_map)
+        flow_fields = FlowFields(astar)
+        floor_tiles = [(x, y) for x in range(game_map.width) for y in range(game_map.height)
+                       if not game_map.is_wall[x, y] and not game_map.is_cover[x, y]]
+        for _ in range(walks_per_map):
+            start, end, *blockers = random.sample(floor_tiles, num_blockers + 2)
+            occupied_nodes = dict.fromkeys(blockers, True)
+            occupancy_version += 1
+            path = astar.find_path(start, end, occupied_nodes)
+            if len(path) < 2: # Walled in by the occupied tiles
+                for _ in range(2):
+                    if flow_fields.next_step(start, end, occupied_nodes, occupancy_version) is not None:
+                        raise AssertionError(f"Flow field found a step from {start} to {end}, A* finds no path")
+                continue
+            pos, steps = start, 0
+            while pos is not None and pos != end and steps < len(path):
+                pos = flow_fields.next_step(pos, end, occupied_nodes, occupancy_version)
+                steps += 1
+            if pos != end or steps != len(path) - 1:
+                raise AssertionError(f"Flow field walk from {start} to {end} took {steps} steps to reach {pos}, A* takes {len(path) - 1}")
+            walks += 1
+    return walks
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare A* and Jump Point Search on generated maps.")
+    parser.add_argument('--maps', type=int, default=20)
+    parser.add_argument('--queries', type=int, default=200, help="Random start/end pairs per map")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    totals = run_benchmark(args.maps, args.queries, args.seed)
+    num_queries = args.maps * args.queries
+    print(f"{num_queries} queries on {args.maps} maps of {settings.MAP_WIDTH}x{settings.MAP_HEIGHT}, all path lengths equal")
+    print(f"{'':6}{'nodes expanded':>16}{'per query':>12}{'ms per query':>14}")
+    for name, (expanded, seconds) in totals.items():
+        print(f"{name:6}{expanded:>16}{expanded / num_queries:>12.1f}{seconds * 1000 / num_queries:>14.3f}")
+    walks = check_flow_field_walks(args.maps, args.queries // 4, args.seed)
+    print(f"{walks} flow field walks around occupied tiles, all as short as A*")
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,31 @@ class Camera:
         self.x, self.y = 0, 0
         self.width, self.height = viewport_width, viewport_height
         self.map_pixel_width, self.map_pixel_height = map_pixel_width, map_pixel_height
+        self.update_view()
+
+    def update_view(self):
+        """Works out which map tiles are under the viewport for this frame and resets the culled draw count."""
+        x, y = int(self.x), int(self.y)
+        self.view_min_x, self.view_min_y = x // settings.TILE_SIZE, y // settings.TILE_SIZE
+        self.view_max_x = (x + self.width - 1) // settings.TILE_SIZE
+        self.view_max_y = (y + self.height - 1) // settings.TILE_SIZE
+        self.draw_calls_culled = 0
+
+    def visible_tile_range(self):
+        """Returns (min_x, min_y, max_x, max_y), the inclusive range of tiles found by update_view."""
+        return self.view_min_x, self.view_min_y, self.view_max_x, self.view_max_y
+
+    def box_in_view(self, min_x, min_y, max_x, max_y, margin=0):
+        """True if the tile box overlaps the viewport widened by margin tiles. Counts a culled draw call if not."""
+        if (max_x < self.view_min_x - margin or min_x > self.view_max_x + margin or
+                max_y < self.view_min_y - margin or min_y > self.view_max_y + margin):
+            self.draw_calls_culled += 1
+            return False
+        return True
+
+    def in_view(self, x, y, margin=0):
+        """True if tile (x, y) is within margin tiles of the viewport. Counts a culled draw call if not."""
+        return self.box_in_view(x, y, x, y, margin)
     
     def apply_coords(self, x, y):
         """Converts map coordinates to screen coordinates."""
@@ -19,20 +44,20 @@ class Camera:
         """Centers the camera on a specific unit."""
         target_x = unit.x * settings.TILE_SIZE - self.width // 2
         target_y = unit.y * settings.TILE_SIZE - self.height // 2
-        self.x = max(0, min(target_x, self.map_pixel_width - self.width))
-        self.y = max(0, min(target_y, self.map_pixel_height - self.height))
+        self.x = int(max(0, min(target_x, self.map_pixel_width - self.width)))
+        self.y = int(max(0, min(target_y, self.map_pixel_height - self.height)))
         
     def center_on_coords(self, map_x, map_y):
         """Centers the camera on specific map coordinates."""
         target_x = map_x * settings.TILE_SIZE - self.width // 2
         target_y = map_y * settings.TILE_SIZE - self.height // 2
-        self.x = max(0, min(target_x, self.map_pixel_width - self.width))
-        self.y = max(0, min(target_y, self.map_pixel_height - self.height))
+        self.x = int(max(0, min(target_x, self.map_pixel_width - self.width)))
+        self.y = int(max(0, min(target_y, self.map_pixel_height - self.height)))
 
     def scroll(self, dx=0, dy=0):
         """Scrolls the camera by a delta value."""
         self.x += dx
         self.y += dy
         # Clamp camera to map boundaries
-        self.x = max(0, min(self.x, self.map_pixel_width - self.width))
-        self.y = max(0, min(self.y, self.map_pixel_height - self.height))
+        self.x = int(max(0, min(self.x, self.map_pixel_width - self.width)))
+        self.y = int(max(0, min(self.y, self.map_pixel_height - self.height)))
@@ -0,0 +1,185 @@
+import random
+import settings
+from map import GameMap
+from pathfinding import FlowFields, create_pathfinder
+from sprites import Unit
+import sounds
+import ai
+
+class Engine:
+    """
+    The game rules and state: map, squads, combat, turns and AI.
+    Nothing here draws or reads input, so matches can be simulated without pygame.
+    """
+    def __init__(self, seed=None):
+        self.reset_game(seed)
+
+    def reset_game(self, seed=None):
+        """
+        Resets the game to its initial state to play again.
+        Everything random in a game follows from its seed, so the same seed replays the same game.
+        A new seed is picked if none is given.
+        """
+        self.seed = seed if seed is not None else random.SystemRandom().randrange(2**32)
+        # Independent streams, so e.g. an extra combat roll doesn't change the AI's choices
+        self.map_rng = random.Random(f"{self.seed}/map")
+        self.combat_rng = random.Random(f"{self.seed}/combat")
+        self.ai_rng = random.Random(f"{self.seed}/ai")
+        # A room for the player squad and one for each enemy squad, whose centers are the spawn points
+        self.game_map = GameMap(settings.MAP_WIDTH, settings.MAP_HEIGHT, self.map_rng, min_rooms=settings.NUM_ENEMY_SQUADS + 1)
+        self.unit_index = self.game_map.unit_index
+
+        self.astar = create_pathfinder(self.game_map)
+        self.flow_fields = FlowFields(self.astar)
+        self.player_squad, self.enemy_squads, self.all_enemies = [], [], []
+        self.squad_ai_states = []
+        self.ai_vision_cache_stats = {'hits': 0, 'misses': 0}
+        self._spawn_units()
+        
+        self.game_state = 'HOME_SCREEN'
+        self.selected_unit = None
+        self.laser_effects = []
+        self.skill_check_messages = []
+        self.turn_number = 1
+        
+        self.game_over_message = ""
+
+    def _find_spawn_tiles(self, start_x, start_y, count):
+        spawn_tiles = []
+        occupied_tiles = set(self.unit_index.tiles)
+
+        def is_valid_spawn(x, y):
+            return (self.game_map.is_in_bounds(x, y) and
+                    not self.game_map.is_wall[x, y] and
+                    (x, y) not in occupied_tiles)
+
+        if is_valid_spawn(start_x, start_y):
+            spawn_tiles.append((start_x, start_y)); occupied_tiles.add((start_x, start_y))
+        for radius in range(1, 10):
+            if len(spawn_tiles) >= count: break
+            for dx in range(-radius, radius + 1):
+                for dy in range(-radius, radius + 1):
+                    if abs(dx) != radius and abs(dy) != radius: continue
+                    x, y = start_x + dx, start_y + dy
+                    if is_valid_spawn(x, y):
+                        spawn_tiles.append((x, y)); occupied_tiles.add((x, y))
+                        if len(spawn_tiles) >= count: break
+                if len(spawn_tiles) >= count: break
+        return spawn_tiles
+
+    def _spawn_units(self):
+        spawn_points = self.map_rng.sample(self.game_map.spawn_points, settings.NUM_ENEMY_SQUADS + 1)
+        player_start_center = spawn_points.pop(0)
+        player_spawns = self._find_spawn_tiles(player_start_center[0], player_start_center[1], settings.SQUAD_SIZE)
+        for i, (x, y) in enumerate(player_spawns[:settings.SQUAD_SIZE]):
+            name = settings.PHONETIC_ALPHABET[i]
+            self.player_squad.append(Unit(x, y, 'player', self.game_map, name=name, number=i+1))
+
+        for sp in spawn_points:
+            new_squad = []
+            enemy_spawns = self._find_spawn_tiles(sp[0], sp[1], settings.SQUAD_SIZE)
+            for x, y in enemy_spawns:
+                new_squad.append(Unit(x, y, 'enemy', self.game_map))
+            self.enemy_squads.append(new_squad)
+            self.all_enemies.extend(new_squad)
+            self.squad_ai_states.append(ai.new_squad_state())
+
+    def handle_heal(self, healer, target):
+        healer.ap -= settings.HEAL_COST; healer.heals_given += 1; target.heal(settings.HEAL_AMOUNT)
+    def get_unit_at(self, x, y, team):
+        return self.unit_index.unit_at(x, y, team)
+    def perform_skill_check(self, attacker, target, skill_bonus):
+        roll = self.combat_rng.randint(1, 20); total = roll + skill_bonus
+        dc = settings.TARGET_DC_BASE
+        if target.posture == 'prone': dc += settings.TARGET_DC_MOD_PRONE
+        if total >= dc: self.display_skill_check("Success!", (target.x, target.y), settings.COLOR_SUCCESS); return True
+        else: self.display_skill_check("Miss!", (target.x, target.y), settings.COLOR_FAIL); return False
+    def display_skill_check(self, message, pos, color):
+        self.skill_check_messages.append({'text': message, 'pos': pos, 'timer': 60, 'color': color})
+
+    def handle_move(self, unit, x, y):
+        unit.set_position(x, y); unit.ap -= settings.MOVE_COST; unit.distance_travelled += 2; sounds.play('move')
+
+    def handle_ranged_attack(self, attacker, target):
+        if self.handle_reaction_fire(attacker): return
+        if attacker.ap < settings.SHOOT_COST: return
+        attacker.shots_taken += 1; attacker.is_on_overwatch = False; attacker.has_fired_overwatch = False; attacker.ap -= settings.SHOOT_COST
+        los_path = self.game_map.get_line_of_sight(attacker, (target.x, target.y))
+        if los_path and los_path[-1] == (target.x, target.y):
+            if self.perform_skill_check(attacker, target, attacker.ranged_skill):
+                attacker.shots_hit += 1; damage = settings.LASER_DAMAGE if attacker.team == 'player' else settings.ENEMY_LASER_DAMAGE
+                sounds.play('laser'); was_alive = target.is_alive; target.take_damage(damage)
+                if was_alive and not target.is_alive: attacker.kills += 1
+                self.laser_effects.append(((attacker.x, attacker.y), (target.x, target.y), 30)); self.check_game_over()
+    
+    def handle_melee_attack(self, attacker, target):
+        if self.handle_reaction_fire(attacker): return
+        if attacker.ap < settings.MELEE_COST: return
+        attacker.shots_taken += 1; attacker.is_on_overwatch = False; attacker.has_fired_overwatch = False; attacker.ap -= settings.MELEE_COST
+        if self.perform_skill_check(attacker, target, attacker.melee_skill):
+             attacker.shots_hit += 1; was_alive = target.is_alive; target.take_damage(settings.MELEE_DAMAGE)
+             if was_alive and not target.is_alive: attacker.kills += 1
+             self.check_game_over()
+    def check_game_over(self):
+        if not self.unit_index.alive('player'): self.game_over_message = "DEFEAT"; self.game_state = 'GAME_OVER'
+        elif not self.unit_index.alive('enemy'): self.game_over_message = "VICTORY"; self.game_state = 'GAME_OVER'
+
+    def handle_reaction_fire(self, acting_unit):
+        """Lets the other team's units on overwatch fire at acting_unit. Returns True if it was killed."""
+        overwatch = self.game_map.overwatch
+        for unit in overwatch.watchers_against(acting_unit.team):
+            if not unit.has_fired_overwatch and overwatch.has_clear_shot(unit, (acting_unit.x, acting_unit.y)):
+                unit.shots_taken += 1
+                if self.perform_skill_check(unit, acting_unit, unit.ranged_skill):
+                    unit.shots_hit += 1; sounds.play('laser'); was_alive = acting_unit.is_alive
+                    acting_unit.take_damage(settings.LASER_DAMAGE if unit.team == 'player' else settings.ENEMY_LASER_DAMAGE)
+                    if was_alive and not acting_unit.is_alive: unit.kills += 1
+                    self.laser_effects.append(((unit.x, unit.y), (acting_unit.x, acting_unit.y), 30))
+                    unit.has_fired_overwatch = True; unit.is_on_overwatch = False; self.check_game_over()
+                    if not acting_unit.is_alive: return True 
+        return False
+
+    def start_player_turn(self):
+        self.game_state = 'PLAYER_TURN'
+        if self.player_squad:
+            first_alive = next((u for u in self.player_squad if u.is_alive), None)
+            if first_alive:
+                self.selected_unit = first_alive
+                self.selected_unit.is_selected = True
+            else:
+                 self.selected_unit = None
+
+        for unit in self.unit_index.alive('player'):
+            unit.ap = settings.UNIT_MAX_AP; unit.has_fired_overwatch = False
+        self.game_map.update_fov(self.player_squad)
+
+    def end_player_turn(self):
+        self.game_state = 'ENEMY_TURN'
+        for unit in self.unit_index.alive('enemy'):
+            unit.ap = settings.UNIT_MAX_AP
+
+    def end_enemy_turn(self):
+        self.turn_number += 1; self.start_player_turn()
+
+    def update_effects(self):
+        """Counts down the laser effects and skill check messages, dropping the ones that have expired."""
+        self.skill_check_messages = [m for m in self.skill_check_messages if m['timer'] > 0]
+        for m in self.skill_check_messages: m['timer'] -= 1
+        self.laser_effects = [(s, e, t - 1) for s, e, t in self.laser_effects if t > 1]
+
+    def run_match(self, max_turns=None):
+        """
+        Plays the player squad's AI against the enemy squads' until one side is wiped out or
+        max_turns (default settings.MATCH_MAX_TURNS) turns have passed.
+        Returns the winning team ('player' or 'enemy'), or None for a draw.
+        """
+        if max_turns is None: max_turns = settings.MATCH_MAX_TURNS
+        self.player_ai_states = [ai.new_squad_state()]
+        self.start_player_turn()
+        while self.game_state != 'GAME_OVER' and self.turn_number <= max_turns:
+            if self.game_state == 'PLAYER_TURN':
+                if not ai.run_squads_ai(self, [self.player_squad], self.player_ai_states, self.all_enemies): self.end_player_turn()
+            elif not ai.run_squads_ai(self, self.enemy_squads, self.squad_ai_states, self.player_squad): self.end_enemy_turn()
+            self.update_effects()
+        if self.game_state != 'GAME_OVER': return None
+        return 'player' if self.game_over_message == "VICTORY" else 'enemy'
@@ -1,19 +1,26 @@
+import argparse
 import pygame
-
-# Initialize Pygame and its modules at the very start.
-# This ensures that all pygame modules are ready before any other
-# game files (like sounds.py) are imported and try to use them.
-pygame.mixer.pre_init(44100, -16, 2, 512)
-pygame.init()
-pygame.font.init()
-
-# Now it's safe to import our game modules
+import sounds
 from game import Game
 
 def main():
     """
     Main function to initialize and run the game.
     """
+    parser = argparse.ArgumentParser(description="Play Laser Squad.")
+    parser.add_argument('--no-audio', action='store_true', help="Run without sound: no mixer is opened and no effects are synthesized")
+    args = parser.parse_args()
+
+    # Initialize Pygame and its modules before the window is created.
+    if args.no_audio:
+        sounds.enabled = False
+        pygame.display.init()
+    else:
+        # The mixer settings must be set before pygame.init() starts the mixer.
+        pygame.mixer.pre_init(sounds.SAMPLE_RATE, -16, 2, 512)
+        pygame.init()
+    pygame.font.init()
+
     game = Game()
     game.run()
 
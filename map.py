@@ -1,136 +1,330 @@
-import pygame
 import random
 import math
+import functools
+import numpy
 from sprites import Tile
+from spatial import SpatialIndex, OverwatchIndex
 import settings
 
+def _ray_step(x1, y1, dx, dy, i):
+    """The i-th point of the DDA line from (x1, y1) along (dx, dy), exactly as get_line_of_sight walks it."""
+    steps = max(abs(dx), abs(dy))
+    x_inc, y_inc = dx / steps, dy / steps
+    return int(round(x1 + i * x_inc)), int(round(y1 + i * y_inc))
+
+@functools.lru_cache(maxsize=4096)
+def _build_ray(dx, dy):
+    """
+    Returns the offsets of the DDA line from (0, 0) to (dx, dy), and the steps that land
+    exactly halfway between two tiles. round() breaks those ties towards the even tile,
+    which depends on the absolute start position, so they are recomputed with _ray_step.
+    """
+    steps = max(abs(dx), abs(dy))
+    offsets = tuple(_ray_step(0, 0, dx, dy, i) for i in range(steps + 1))
+    ties = frozenset(i for i in range(steps + 1)
+                     if any((2 * i * d) % steps == 0 and (2 * i * d // steps) % 2 for d in (dx, dy)))
+    return offsets, ties
+
+# Rays for every offset within LOS_TABLE_RANGE, so line of sight is a walk over precomputed offsets.
+# Longer rays are built on demand and kept in _build_ray's LRU cache.
+_RAY_TABLE = {(dx, dy): _build_ray(dx, dy)
+              for dx in range(-settings.LOS_TABLE_RANGE, settings.LOS_TABLE_RANGE + 1)
+              for dy in range(-settings.LOS_TABLE_RANGE, settings.LOS_TABLE_RANGE + 1)
+              if dx or dy}
+
+class TileColumn:
+    """A single column of the tile grid, so that tiles[x][y] returns a Tile view."""
+    __slots__ = ('game_map', 'x')
+    def __init__(self, game_map, x):
+        self.game_map = game_map
+        self.x = x
+
+    def __getitem__(self, y):
+        return Tile(self.game_map, self.x, y)
+
+    def __len__(self):
+        return self.game_map.height
+
+    def __iter__(self):
+        return (Tile(self.game_map, self.x, y) for y in range(self.game_map.height))
+
+class TileGrid:
+    """Compatibility view giving list-of-lists access (tiles[x][y]) to the map's tile arrays."""
+    __slots__ = ('game_map',)
+    def __init__(self, game_map):
+        self.game_map = game_map
+
+    def __getitem__(self, x):
+        return TileColumn(self.game_map, x)
+
+    def __len__(self):
+        return self.game_map.width
+
+    def __iter__(self):
+        return (TileColumn(self.game_map, x) for x in range(self.game_map.width))
+
+class Room:
+    """A rectangle of floor carved out by the map generator. right and bottom are exclusive."""
+    def __init__(self, x, y, w, h):
+        self.left, self.top, self.right, self.bottom = x, y, x + w, y + h
+        self.centerx, self.centery = x + w // 2, y + h // 2
+        self.center = (self.centerx, self.centery)
+
+    def intersects(self, other, margin=0):
+        """True if the rooms overlap, or come within margin tiles of each other."""
+        return (self.left < other.right + margin and other.left - margin < self.right and
+                self.top < other.bottom + margin and other.top - margin < self.bottom)
+
 class GameMap:
-    """Manages the map grid and tile properties."""
-    def __init__(self, width, height):
+    """
+    Manages the map grid and tile properties.
+    Tile state is stored as NumPy arrays indexed [x, y]; self.tiles is a thin
+    view over them for code that still expects tiles[x][y].is_wall.
+    """
+    def __init__(self, width, height, rng=random, min_rooms=0):
         self.width = width
         self.height = height
-        self.tiles = self._generate_map()
+        self.rng = rng # Used for generation; anything with the random module's interface, e.g. a seeded random.Random
+        self.is_wall = numpy.ones((width, height), dtype=bool)
+        self.is_cover = numpy.zeros((width, height), dtype=bool) # Low wall or object
+        self.is_visible = numpy.zeros((width, height), dtype=bool)
+        self.is_explored = numpy.zeros((width, height), dtype=bool)
+        # Incremental FOV: how many units currently see each tile, and the tiles each unit sees
+        self.visible_count = numpy.zeros((width, height), dtype=numpy.uint16)
+        self.unit_fov = {}
+        # Where the living units stand, kept up to date by Unit.set_position and Unit.die
+        self.overwatch = OverwatchIndex(self)
+        self.unit_index = SpatialIndex(self.overwatch.tile_changed)
+        self.tiles = TileGrid(self)
+        self._generate_map(min_rooms)
 
-    def _generate_map(self):
-        """Generates a random map with rooms and corridors."""
-        tiles = [[Tile(x, y, is_wall=True) for y in range(self.height)] for x in range(self.width)]
+    def _generate_map(self, min_rooms):
+        """
+        Generates a random map with rooms and corridors, with at least min_rooms rooms.
+        Rooms are tried against a mask of the tiles taken by earlier rooms and their margins, and
+        rooms, cover and tunnels are laid out with whole-map array operations, so large maps are quick.
+        """
+        # Everything random below comes from this generator, seeded from self.rng so maps follow its seed
+        generator = numpy.random.default_rng(self.rng.getrandbits(64))
+        num_attempts = max(30, self.width * self.height // settings.MAP_TILES_PER_ROOM_ATTEMPT)
+        taken = numpy.zeros((self.width, self.height), dtype=bool)
         rooms = []
-        num_rooms = 30
-        for _ in range(num_rooms):
-            w = random.randint(5, 10)
-            h = random.randint(5, 10)
-            x = random.randint(1, self.width - w - 1)
-            y = random.randint(1, self.height - h - 1)
-            new_room = pygame.Rect(x, y, w, h)
-            failed = False
-            for other_room in rooms:
-                if new_room.colliderect(other_room.inflate(2, 2)):
-                    failed = True
-                    break
-            if not failed:
-                for i in range(new_room.left, new_room.right):
-                    for j in range(new_room.top, new_room.bottom):
-                        tiles[i][j].is_wall = False
-                        # Add some random cover objects
-                        if random.random() < 0.1:
-                            tiles[i][j].is_cover = True
-
-                if rooms:
-                    prev_room = rooms[-1]
-                    self._create_tunnel(tiles, prev_room.centerx, prev_room.centery, new_room.centerx, new_room.centery)
-                rooms.append(new_room)
+        attempts = 0
+        while attempts < num_attempts or len(rooms) < min_rooms:
+            if attempts >= num_attempts * 100:
+                raise ValueError(f"Could not fit {min_rooms} rooms on a {self.width}x{self.height} map")
+            # Draw candidate rooms in batches; each is (x, y, w, h) with x, y at least 1 from the edge
+            batch_size = min(num_attempts, 1024)
+            ws = generator.integers(5, 11, batch_size)
+            hs = generator.integers(5, 11, batch_size)
+            xs = generator.integers(1, self.width - ws)
+            ys = generator.integers(1, self.height - hs)
+            # taken only grows, so a candidate with a corner or its center taken now can be dropped up front
+            blocked = taken[xs, ys] | taken[xs + ws - 1, ys + hs - 1] | taken[xs + ws // 2, ys + hs // 2]
+            for x, y, w, h, is_blocked in zip(xs.tolist(), ys.tolist(), ws.tolist(), hs.tolist(), blocked.tolist()):
+                if attempts >= num_attempts and len(rooms) >= min_rooms: break
+                attempts += 1
+                if is_blocked or taken[x:x + w, y:y + h].any(): continue
+                taken[x - 1:x + w + 1, y - 1:y + h + 1] = True # Rooms keep at least one wall between them
+                rooms.append(Room(x, y, w, h))
+        self.rooms = rooms
+        self._index_rooms()
+
+        in_room = self.room_index >= 0
+        self.is_wall[:] = ~in_room
+        self.is_cover[:] = in_room & (generator.random((self.width, self.height)) < 0.1) # Some random cover objects
+        tunnels = self._tunnel_mask(generator.random(max(len(rooms) - 1, 0)) < 0.5)
+        self.is_wall &= ~tunnels
+        self.is_cover &= ~tunnels
         self.spawn_points = [room.center for room in rooms] if rooms else [(self.width//2, self.height//2)]
-        return tiles
-
-    def _create_tunnel(self, tiles, x1, y1, x2, y2):
-        """Carves a tunnel between two points."""
-        if random.random() < 0.5:
-            for x in range(min(x1, x2), max(x1, x2) + 1):
-                tiles[x][y1].is_wall = False; tiles[x][y1].is_cover = False
-            for y in range(min(y1, y2), max(y1, y2) + 1):
-                tiles[x2][y].is_wall = False; tiles[x2][y].is_cover = False
-        else:
-            for y in range(min(y1, y2), max(y1, y2) + 1):
-                tiles[x1][y].is_wall = False; tiles[x1][y].is_cover = False
-            for x in range(min(x1, x2), max(x1, x2) + 1):
-                tiles[x][y2].is_wall = False; tiles[x][y2].is_cover = False
-
-    def draw(self, surface, camera):
-        """Draws the visible and explored parts of the map."""
-        for x in range(self.width):
-            for y in range(self.height):
-                tile = self.tiles[x][y]
-                if tile.is_explored:
-                    pos_x, pos_y = camera.apply_coords(x, y)
-                    rect = pygame.Rect(pos_x, pos_y, settings.TILE_SIZE, settings.TILE_SIZE)
-                    if tile.is_visible:
-                        color = settings.COLOR_WALL if tile.is_wall else settings.COLOR_FLOOR_VISIBLE
-                        if tile.is_cover:
-                           color = settings.COLOR_COVER
-                    else:
-                        color = settings.COLOR_WALL if tile.is_wall else settings.COLOR_FLOOR_EXPLORED
-                        if tile.is_cover:
-                           color = settings.COLOR_DARK_GRAY
-                    
-                    pygame.draw.rect(surface, color, rect)
-                    if tile.is_cover: # Draw a smaller rect to indicate cover
-                        cover_rect = pygame.Rect(pos_x + 5, pos_y + 5, settings.TILE_SIZE - 10, settings.TILE_SIZE - 10)
-                        pygame.draw.rect(surface, settings.COLOR_GRAY, cover_rect, 3)
 
+    def _tunnel_mask(self, horizontal_first):
+        """
+        Returns the tiles of the L-shaped tunnels joining each room to the nearest room placed before it,
+        going horizontally first where horizontal_first is set. Each leg is marked at its two ends
+        in a difference array, so a cumulative sum fills in every tunnel at once.
+        """
+        if len(self.rooms) < 2:
+            return numpy.zeros((self.width, self.height), dtype=bool)
+        centers = numpy.array([room.center for room in self.rooms])
+        (x1, y1), (x2, y2) = centers[self._nearest_earlier_rooms(centers)].T, centers[1:].T
+        row = numpy.where(horizontal_first, y1, y2) # Of the horizontal leg
+        column = numpy.where(horizontal_first, x2, x1) # Of the vertical leg
+        rows = numpy.zeros((self.width + 1, self.height), dtype=numpy.int32)
+        numpy.add.at(rows, (numpy.minimum(x1, x2), row), 1)
+        numpy.add.at(rows, (numpy.maximum(x1, x2) + 1, row), -1)
+        columns = numpy.zeros((self.width, self.height + 1), dtype=numpy.int32)
+        numpy.add.at(columns, (column, numpy.minimum(y1, y2)), 1)
+        numpy.add.at(columns, (column, numpy.maximum(y1, y2) + 1), -1)
+        numpy.cumsum(rows, axis=0, dtype=numpy.int32, out=rows)
+        numpy.cumsum(columns, axis=1, dtype=numpy.int32, out=columns)
+        return (rows[:-1] > 0) | (columns[:, :-1] > 0)
+
+    def _nearest_earlier_rooms(self, centers, block_size=256):
+        """
+        Returns, for each room after the first, the index of the earlier room whose center is nearest its own.
+        Joining rooms this way keeps every room connected with short tunnels, however large the map.
+        Distances are worked out a block of rooms at a time, to bound the memory used.
+        """
+        xs, ys = centers.astype(numpy.int32).T
+        nearest = numpy.empty(len(centers) - 1, dtype=numpy.intp)
+        for start in range(1, len(centers), block_size):
+            end = min(start + block_size, len(centers))
+            dx = xs[start:end, None] - xs[None, :end]
+            dy = ys[start:end, None] - ys[None, :end]
+            distances = dx * dx
+            distances += dy * dy
+            distances[:, start:][numpy.triu_indices(end - start)] = numpy.iinfo(numpy.int32).max # Only earlier rooms
+            nearest[start - 1:end - 1] = distances.argmin(axis=1)
+        return nearest
+
+    def _index_rooms(self):
+        """
+        Keeps room_index, which maps each tile to the index of the room it lies in, or -1.
+        Rooms don't overlap, so each adds its index + 1 at its corners in a 2D difference array.
+        """
+        corners = numpy.zeros((self.width + 1, self.height + 1), dtype=numpy.int32)
+        if self.rooms:
+            left, top, right, bottom = numpy.array([(r.left, r.top, r.right, r.bottom) for r in self.rooms]).T
+            ids = numpy.arange(1, len(self.rooms) + 1, dtype=numpy.int32)
+            numpy.add.at(corners, (left, top), ids)
+            numpy.add.at(corners, (right, top), -ids)
+            numpy.add.at(corners, (left, bottom), -ids)
+            numpy.add.at(corners, (right, bottom), ids)
+        numpy.cumsum(corners, axis=0, dtype=numpy.int32, out=corners)
+        numpy.cumsum(corners, axis=1, dtype=numpy.int32, out=corners)
+        self.room_index = corners[:-1, :-1] - 1
 
     def is_in_bounds(self, x, y):
         return 0 <= x < self.width and 0 <= y < self.height
 
-    def get_line_of_sight(self, shooter, target_pos, all_units):
+    def get_line_of_sight(self, shooter, target_pos, units_block=True):
+        """
+        Returns the tiles on the line from the shooter towards target_pos, up to the first blocking tile.
+        The shot is clear if the line ends on target_pos. Living units in unit_index block
+        the line unless units_block is False.
+        """
         x1, y1 = shooter.x, shooter.y
         x2, y2 = target_pos
         dx, dy = x2 - x1, y2 - y1
-        steps = max(abs(dx), abs(dy))
-        if steps == 0: return []
-        x_inc, y_inc = dx / steps, dy / steps
-        
+        if dx == 0 and dy == 0: return []
+        offsets, ties = _RAY_TABLE.get((dx, dy)) or _build_ray(dx, dy)
+        check_bounds = not self.is_in_bounds(x2, y2) # A ray never leaves the box spanned by its end points
+        prone = shooter.posture == 'prone'
+        occupied_tiles = self.unit_index.tiles
+
         line = []
-        unit_positions = { (unit.x, unit.y): unit for unit in all_units if unit.is_alive and unit is not shooter }
-
-        for i in range(int(steps) + 1):
-            x, y = int(round(x1 + i * x_inc)), int(round(y1 + i * y_inc))
-            current_pos = (x, y)
-            if not self.is_in_bounds(x,y): break
-            line.append(current_pos)
-            
-            if current_pos == target_pos: continue
-            
-            tile = self.tiles[x][y]
-            if tile.is_wall: return line # Blocked by high wall
-            if tile.is_cover and shooter.posture == 'prone': return line # Prone shooter can't shoot over cover
-
-            if current_pos in unit_positions:
-                blocking_unit = unit_positions[current_pos]
-                if tile.is_cover and blocking_unit.posture == 'prone':
-                    continue # Can shoot over a prone unit in cover
-                return line # Blocked by another unit
+        for i, (ox, oy) in enumerate(offsets):
+            if i in ties:
+                x, y = _ray_step(x1, y1, dx, dy, i)
+            else:
+                x, y = x1 + ox, y1 + oy
+            if check_bounds and not self.is_in_bounds(x, y): break
+            line.append((x, y))
+
+            if x == x2 and y == y2: continue
+
+            if self.is_wall[x, y]: return line # Blocked by high wall
+            is_cover = self.is_cover[x, y]
+            if is_cover and prone: return line # Prone shooter can't shoot over cover
+
+            if units_block and (x, y) in occupied_tiles:
+                blocking_units = [unit for unit in occupied_tiles[(x, y)] if unit is not shooter]
+                if blocking_units:
+                    if is_cover and blocking_units[-1].posture == 'prone':
+                        continue # Can shoot over a prone unit in cover
+                    return line # Blocked by another unit
         return line
 
     def update_fov(self, units):
-        for row in self.tiles:
-            for tile in row:
-                tile.is_visible = False
-        
-        visible_tiles = self.calculate_visible_tiles(units)
-        for x, y in visible_tiles:
-            if self.is_in_bounds(x, y):
-                self.tiles[x][y].is_visible = True
-                self.tiles[x][y].is_explored = True
+        """Recomputes the visibility of the whole map from scratch for the given units."""
+        self.is_visible[:] = False
+        self.visible_count[:] = 0
+        self.unit_fov = {}
+        for unit in units:
+            self.update_unit_fov(unit)
+
+    def update_unit_fov(self, unit):
+        """
+        Updates visibility after a single unit has moved or died.
+        Only the difference between the unit's old and new sight is applied to the
+        per-tile visibility counts, so the cost is one unit's vision rather than the squad's.
+        """
+        old_tiles = self.unit_fov.pop(unit, set())
+        new_tiles = self.calculate_unit_visible_tiles(unit) if unit.is_alive else set()
+        if new_tiles:
+            self.unit_fov[unit] = new_tiles
+
+        hidden = old_tiles - new_tiles
+        if hidden:
+            xs, ys = zip(*hidden)
+            self.visible_count[xs, ys] -= 1
+            self.is_visible[xs, ys] = self.visible_count[xs, ys] > 0
+        revealed = new_tiles - old_tiles
+        if revealed:
+            xs, ys = zip(*revealed)
+            self.visible_count[xs, ys] += 1
+            self.is_visible[xs, ys] = True
+            self.is_explored[xs, ys] = True
 
     def calculate_visible_tiles(self, units):
+        """Returns the set of tiles seen by any living unit."""
         visible_coords = set()
         for unit in units:
             if not unit.is_alive: continue
-            for x in range(unit.x - settings.UNIT_VISION_RADIUS, unit.x + settings.UNIT_VISION_RADIUS + 1):
-                for y in range(unit.y - settings.UNIT_VISION_RADIUS, unit.y + settings.UNIT_VISION_RADIUS + 1):
-                    if self.is_in_bounds(x,y) and math.dist((unit.x, unit.y), (x,y)) <= settings.UNIT_VISION_RADIUS:
-                        line = self.get_line_of_sight(unit, (x, y), [])
-                        if line and line[-1] == (x,y):
-                            for lx, ly in line:
-                                visible_coords.add((lx, ly))
+            visible_coords |= self.calculate_unit_visible_tiles(unit)
+        return visible_coords
+
+    def calculate_unit_visible_tiles(self, unit):
+        """Returns the set of in-bounds tiles seen by one unit, using the engine chosen by settings.FOV_ALGORITHM."""
+        if settings.FOV_ALGORITHM == 'raycast':
+            return self._raycast_visible_tiles(unit)
+        return self._shadowcast_visible_tiles(unit)
+
+    def _raycast_visible_tiles(self, unit):
+        """Casts a line of sight to every tile within vision range of the unit."""
+        visible_coords = set()
+        for x in range(unit.x - settings.UNIT_VISION_RADIUS, unit.x + settings.UNIT_VISION_RADIUS + 1):
+            for y in range(unit.y - settings.UNIT_VISION_RADIUS, unit.y + settings.UNIT_VISION_RADIUS + 1):
+                if self.is_in_bounds(x,y) and math.dist((unit.x, unit.y), (x,y)) <= settings.UNIT_VISION_RADIUS:
+                    line = self.get_line_of_sight(unit, (x, y), units_block=False)
+                    if line and line[-1] == (x,y):
+                        for lx, ly in line:
+                            visible_coords.add((lx, ly))
+        return visible_coords
+
+    def _shadowcast_visible_tiles(self, unit):
+        """
+        Symmetric shadowcasting: scans each quadrant around the unit row by row in a single pass.
+        Walls are seen but block sight; cover only blocks the sight of a prone unit, as in get_line_of_sight.
+        """
+        radius = settings.UNIT_VISION_RADIUS
+        ox, oy = unit.x, unit.y
+        prone = unit.posture == 'prone'
+        visible_coords = {(ox, oy)}
+
+        # Each quadrant maps (depth, col) to map coordinates: x = ox + col*cx + depth*dx, y = oy + col*cy + depth*dy
+        for cx, dx, cy, dy in ((1, 0, 0, -1), (1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0)):
+            # Rows to scan as (depth, start slope, end slope), slopes kept as exact numerator/denominator pairs
+            rows = [(1, -1, 1, 1, 1)]
+            while rows:
+                depth, start_num, start_den, end_num, end_den = rows.pop()
+                if depth > radius: continue
+                min_col = (2 * depth * start_num + start_den) // (2 * start_den) # depth * start_slope, ties rounded up
+                max_col = -((end_den - 2 * depth * end_num) // (2 * end_den)) # depth * end_slope, ties rounded down
+                prev_blocked = None
+                for col in range(min_col, max_col + 1):
+                    x, y = ox + col * cx + depth * dx, oy + col * cy + depth * dy
+                    in_bounds = self.is_in_bounds(x, y)
+                    blocked = not in_bounds or bool(self.is_wall[x, y] or (prone and self.is_cover[x, y]))
+                    symmetric = col * start_den >= depth * start_num and col * end_den <= depth * end_num
+                    if in_bounds and (blocked or symmetric) and col * col + depth * depth <= radius * radius:
+                        visible_coords.add((x, y))
+                    if prev_blocked and not blocked:
+                        start_num, start_den = 2 * col - 1, 2 * depth
+                    if prev_blocked is False and blocked:
+                        rows.append((depth + 1, start_num, start_den, 2 * col - 1, 2 * depth))
+                    prev_blocked = blocked
+                if prev_blocked is False:
+                    rows.append((depth + 1, start_num, start_den, end_num, end_den))
         return visible_coords
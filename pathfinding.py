@@ -1,10 +1,43 @@
 import heapq
+import collections
+import numpy
+import settings
 
 class AStar:
-    """A* pathfinding algorithm implementation."""
+    """
+    A* pathfinding algorithm implementation.
+    Nodes are flat indices into a grid padded with a one-tile impassable border, so neighbours
+    need no bounds checks. Cost and parent buffers are allocated once and reused between
+    searches; a node's entries are only valid if its stamp matches the current search.
+    """
     def __init__(self, game_map):
         self.game_map = game_map
         self.neighbors = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+        self.stride = game_map.height + 2
+        self.neighbor_steps = [dx * self.stride + dy for dx, dy in self.neighbors]
+
+        # Static passability from the map's walls and cover, built once per map
+        passable = [False] * ((game_map.width + 2) * self.stride)
+        for x, column in enumerate((~(game_map.is_wall | game_map.is_cover)).tolist()):
+            offset = self.index(x, 0)
+            passable[offset:offset + game_map.height] = column
+        self.passable = passable
+
+        size = len(passable)
+        self.cost_so_far = [0] * size
+        self.came_from = [0] * size
+        self.stamp = [0] * size
+        self.search_id = 0
+        self.nodes_expanded = 0 # Nodes taken off the open list by the last search
+
+    def index(self, x, y):
+        """Returns the flat node index of map tile (x, y)."""
+        return (x + 1) * self.stride + y + 1
+
+    def coords(self, node):
+        """Returns the map tile (x, y) of a flat node index."""
+        x, y = divmod(node, self.stride)
+        return x - 1, y - 1
 
     def heuristic(self, a, b):
         return abs(a[0] - b[0]) + abs(a[1] - b[1])
@@ -14,41 +47,477 @@ class AStar:
         Finds a path from start to end using A*.
         occupied_nodes is a set of (x, y) tuples that are considered blocked.
         """
+        search = self._begin_search(start, end, occupied_nodes)
+        if search is None:
+            return []
+        start_node, end_node, blocked = search
+
+        search_id, stride = self.search_id, self.stride
+        passable, cost_so_far, came_from, stamp = self.passable, self.cost_so_far, self.came_from, self.stamp
+        end_x, end_y = divmod(end_node, stride)
+
+        stamp[start_node] = search_id
+        cost_so_far[start_node] = 0
+        frontier = [(0, start_node)]
+        self.nodes_expanded = 0
+        while frontier:
+            _, current = heapq.heappop(frontier)
+            if current == end_node: break
+            self.nodes_expanded += 1
+            new_cost = cost_so_far[current] + 1
+            for step in self.neighbor_steps:
+                next_node = current + step
+                if not passable[next_node] or next_node in blocked:
+                    continue
+                if stamp[next_node] != search_id or new_cost < cost_so_far[next_node]:
+                    stamp[next_node] = search_id
+                    cost_so_far[next_node] = new_cost
+                    came_from[next_node] = current
+                    next_x, next_y = divmod(next_node, stride)
+                    priority = new_cost + abs(end_x - next_x) + abs(end_y - next_y)
+                    heapq.heappush(frontier, (priority, next_node))
+
+        if stamp[end_node] != search_id:
+            return []
+        path = []
+        current = end_node
+        while current != start_node:
+            path.append(self.coords(current))
+            current = came_from[current]
+        path.append(start)
+        path.reverse()
+        return path
+
+    def _begin_search(self, start, end, occupied_nodes):
+        """
+        Starts a new search: returns the start and end nodes and the set of blocked nodes,
+        or None if the end can't be reached at all.
+        """
+        if occupied_nodes is None:
+            occupied_nodes = set()
+        if end in occupied_nodes or not self.game_map.is_in_bounds(*end):
+            return None
+        start_node, end_node = self.index(*start), self.index(*end)
+        if start_node != end_node and not self.passable[end_node]:
+            return None
+        self.search_id += 1
+        return start_node, end_node, {self.index(x, y) for x, y in occupied_nodes}
+
+    def find_reachable(self, start, ap, occupied_nodes=None):
+        """
+        Returns a (width, height) array of the AP cost to reach every tile a unit at start can
+        walk to with ap action points, or -1 where it can't. The search stops expanding once
+        the next step would cost more than the AP left, so its cost depends on the budget
+        rather than the map size.
+        """
         if occupied_nodes is None:
             occupied_nodes = set()
+        blocked = {self.index(x, y) for x, y in occupied_nodes}
+        max_steps = ap // settings.MOVE_COST
+
+        self.search_id += 1
+        search_id, passable, stamp = self.search_id, self.passable, self.stamp
+        start_node = self.index(*start)
+        stamp[start_node] = search_id
+        reached_xs, reached_ys, reached_costs = [start[0]], [start[1]], [0]
+        frontier = [start_node]
+        for steps in range(1, max_steps + 1):
+            next_frontier = []
+            for node in frontier:
+                for step in self.neighbor_steps:
+                    next_node = node + step
+                    if stamp[next_node] == search_id or not passable[next_node] or next_node in blocked:
+                        continue
+                    stamp[next_node] = search_id
+                    next_frontier.append(next_node)
+                    x, y = self.coords(next_node)
+                    reached_xs.append(x); reached_ys.append(y); reached_costs.append(steps * settings.MOVE_COST)
+            if not next_frontier: break
+            frontier = next_frontier
+
+        costs = numpy.full((self.game_map.width, self.game_map.height), -1, dtype=numpy.int16)
+        costs[reached_xs, reached_ys] = reached_costs
+        return costs
 
-        frontier = [(0, start)]
-        came_from, cost_so_far = {start: None}, {start: 0}
-        
-        if end in occupied_nodes:
+    def find_reachable_for_unit(self, unit, occupied_nodes=None):
+        """Returns find_reachable's cost array for a unit with its remaining AP."""
+        return self.find_reachable((unit.x, unit.y), unit.ap, occupied_nodes)
+
+class JumpPointSearch(AStar):
+    """
+    Jump Point Search for the map's 4-connected, uniform-cost grid, behind the same find_path interface.
+    Among equally short paths it only follows those that move horizontally as early as possible, so
+    straight runs can be scanned without touching the open list. A vertical run stops only at the goal
+    or where a wall behind a side opening forces a turn; a horizontal run stops where a vertical scan
+    from it finds such a point. Paths are as short as AStar's while far fewer nodes are expanded.
+    """
+    def find_path(self, start, end, occupied_nodes=None):
+        """
+        Finds a path from start to end using Jump Point Search.
+        occupied_nodes is a set of (x, y) tuples that are considered blocked.
+        """
+        search = self._begin_search(start, end, occupied_nodes)
+        if search is None:
             return []
+        start_node, end_node, blocked = search
+        search_id, stride = self.search_id, self.stride
+        cost_so_far, came_from, stamp = self.cost_so_far, self.came_from, self.stamp
+        end_x, end_y = divmod(end_node, stride)
 
+        stamp[start_node] = search_id
+        cost_so_far[start_node] = 0
+        came_from[start_node] = -1
+        frontier = [(0, start_node)]
+        self.nodes_expanded = 0
         while frontier:
             _, current = heapq.heappop(frontier)
-            if current == end: break
-            for dx, dy in self.neighbors:
-                next_node = (current[0] + dx, current[1] + dy)
-                
-                # --- MODIFICATION: Check against walls, cover, and occupied nodes ---
-                if (not self.game_map.is_in_bounds(next_node[0], next_node[1]) or 
-                        self.game_map.tiles[next_node[0]][next_node[1]].is_wall or
-                        self.game_map.tiles[next_node[0]][next_node[1]].is_cover or
-                        next_node in occupied_nodes):
+            if current == end_node: break
+            self.nodes_expanded += 1
+            for step in self._successor_steps(current, came_from[current], blocked):
+                jump_node = self._jump(current, step, end_node, blocked)
+                if jump_node is None:
                     continue
+                distance = abs(jump_node - current)
+                new_cost = cost_so_far[current] + (distance // stride if distance >= stride else distance)
+                if stamp[jump_node] != search_id or new_cost < cost_so_far[jump_node]:
+                    stamp[jump_node] = search_id
+                    cost_so_far[jump_node] = new_cost
+                    came_from[jump_node] = current
+                    next_x, next_y = divmod(jump_node, stride)
+                    priority = new_cost + abs(end_x - next_x) + abs(end_y - next_y)
+                    heapq.heappush(frontier, (priority, jump_node))
 
-                new_cost = cost_so_far[current] + 1
-                if next_node not in cost_so_far or new_cost < cost_so_far[next_node]:
-                    cost_so_far[next_node] = new_cost
-                    priority = new_cost + self.heuristic(end, next_node)
-                    heapq.heappush(frontier, (priority, next_node))
-                    came_from[next_node] = current
-        
+        if stamp[end_node] != search_id:
+            return []
+        # Walk back over the jump points, filling in the straight runs between them
         path = []
-        current = end
-        while current != start:
-            if current not in came_from: return []
-            path.append(current)
-            current = came_from[current]
+        current = end_node
+        while current != start_node:
+            parent = came_from[current]
+            distance = abs(current - parent)
+            step = (stride if distance >= stride else 1) * (1 if current > parent else -1)
+            while current != parent:
+                path.append(self.coords(current))
+                current -= step
         path.append(start)
         path.reverse()
         return path
+
+    def _is_open(self, node, blocked):
+        return self.passable[node] and node not in blocked
+
+    def _successor_steps(self, node, parent, blocked):
+        """The directions worth jumping in from a node, given the direction it was reached from."""
+        stride = self.stride
+        if parent < 0:
+            return self.neighbor_steps
+        if abs(node - parent) >= stride: # Reached horizontally: keep going, or turn up or down
+            return (stride if node > parent else -stride, 1, -1)
+        step = 1 if node > parent else -1 # Reached vertically: keep going, or take a forced turn
+        steps = [step]
+        for side in (stride, -stride):
+            if self._is_open(node + side, blocked) and not self._is_open(node - step + side, blocked):
+                steps.append(side)
+        return steps
+
+    def _jump(self, node, step, end_node, blocked):
+        """Scans from node in one direction and returns the next jump point, or None at a dead end."""
+        passable, stride = self.passable, self.stride
+        horizontal = step == stride or step == -stride
+        while True:
+            node += step
+            if not passable[node] or node in blocked:
+                return None
+            if node == end_node:
+                return node
+            if horizontal:
+                if self._jump(node, 1, end_node, blocked) is not None or self._jump(node, -1, end_node, blocked) is not None:
+                    return node
+            else:
+                for side in (stride, -stride):
+                    if self._is_open(node + side, blocked) and not self._is_open(node - step + side, blocked):
+                        return node
+
+class HierarchicalPathfinder(AStar):
+    """
+    Plans long paths on an abstract graph of the map's rooms and corridors, then refines them locally.
+    Each room the generator carved is one node, at its centre. Corridors become nodes only where
+    they branch, dead-end or open into a room, joined by edges as long as the corridor run between
+    them. A long search first finds a route over this small graph, then joins its waypoints with short
+    A* legs. Paths can be slightly longer than A*'s, since they pass through room centres, but only
+    tiles near the route are expanded. Short searches fall back to plain A*.
+    """
+    def __init__(self, game_map):
+        super().__init__(game_map)
+        self._build_abstract_graph()
+
+    def _build_abstract_graph(self):
+        """Builds self.graph, mapping each abstract node (a tile) to a list of (neighbour, distance)."""
+        game_map = self.game_map
+        walkable = ~game_map.is_wall
+        padded = numpy.pad(walkable, 1)
+        walkable_neighbors = (padded[2:, 1:-1].astype(int) + padded[:-2, 1:-1] + padded[1:-1, 2:] + padded[1:-1, :-2])
+        in_room = numpy.pad(game_map.room_index >= 0, 1)
+        next_to_room = in_room[2:, 1:-1] | in_room[:-2, 1:-1] | in_room[1:-1, 2:] | in_room[1:-1, :-2]
+        self.corridor = walkable & (game_map.room_index < 0)
+        key_tiles = self.corridor & ((walkable_neighbors != 2) | next_to_room)
+        self.key_tiles = set(zip(*(axis.tolist() for axis in numpy.nonzero(key_tiles))))
+
+        self.graph = collections.defaultdict(list, {room.center: [] for room in game_map.rooms})
+        for key in self.key_tiles:
+            for next_pos in self._corridor_neighbors(key):
+                end, distance = self._follow_corridor(key, next_pos)
+                if end is not None:
+                    self.graph[key].append((end, distance))
+            room = self._adjacent_room(key)
+            if room is not None:
+                center = game_map.rooms[room].center
+                self.graph[key].append((center, self.heuristic(key, center)))
+                self.graph[center].append((key, self.heuristic(key, center)))
+
+    def _corridor_neighbors(self, pos):
+        x, y = pos
+        return [(nx, ny) for nx, ny in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1))
+                if self.game_map.is_in_bounds(nx, ny) and self.corridor[nx, ny]]
+
+    def _adjacent_room(self, pos):
+        x, y = pos
+        for nx, ny in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+            if self.game_map.is_in_bounds(nx, ny) and self.game_map.room_index[nx, ny] >= 0:
+                return int(self.game_map.room_index[nx, ny])
+        return None
+
+    def _follow_corridor(self, prev, current):
+        """Walks a corridor run from prev through current to the next key tile; returns it and its distance."""
+        distance = 1
+        while current not in self.key_tiles:
+            onward = [pos for pos in self._corridor_neighbors(current) if pos != prev]
+            if not onward:
+                return None, distance # A loop with no key tiles on it
+            prev, current = current, onward[0]
+            distance += 1
+        return current, distance
+
+    def _attach(self, pos):
+        """The abstract nodes a tile connects to directly, as (node, distance) pairs."""
+        game_map = self.game_map
+        room = int(game_map.room_index[pos])
+        if room >= 0:
+            center = game_map.rooms[room].center
+            return [(center, self.heuristic(pos, center))]
+        if pos in self.key_tiles:
+            return [(pos, 0)]
+        if self.corridor[pos]:
+            ends = [self._follow_corridor(pos, next_pos) for next_pos in self._corridor_neighbors(pos)]
+            return [(end, distance) for end, distance in ends if end is not None]
+        return []
+
+    def find_path(self, start, end, occupied_nodes=None):
+        """
+        Finds a path from start to end, planning over the room graph when they are far apart.
+        occupied_nodes is a set of (x, y) tuples that are considered blocked.
+        """
+        if occupied_nodes is None:
+            occupied_nodes = set()
+        if self.heuristic(start, end) < settings.HIERARCHICAL_MIN_DISTANCE or not self.game_map.is_in_bounds(*end):
+            return super().find_path(start, end, occupied_nodes)
+        route = self._abstract_route(start, end)
+        if route is None:
+            return super().find_path(start, end, occupied_nodes)
+
+        # Keep waypoints a leg length apart, so legs stay short but don't come with per-search overhead
+        waypoints = [start]
+        for node in route:
+            if (self.heuristic(waypoints[-1], node) >= settings.HIERARCHICAL_LEG_LENGTH
+                    and self.passable[self.index(*node)] and node not in occupied_nodes):
+                waypoints.append(node)
+        waypoints.append(end)
+
+        path, nodes_expanded = [start], 0
+        for leg_start, leg_end in zip(waypoints, waypoints[1:]):
+            leg = super().find_path(leg_start, leg_end, occupied_nodes)
+            nodes_expanded += self.nodes_expanded
+            if not leg:
+                return super().find_path(start, end, occupied_nodes)
+            path.extend(leg[1:])
+        self.nodes_expanded = nodes_expanded
+        return self._remove_loops(path)
+
+    def _abstract_route(self, start, end):
+        """A* over the abstract graph from the nodes next to start to those next to end."""
+        end_links = dict(self._attach(end))
+        frontier, cost_so_far, came_from = [], {}, {}
+        for node, distance in self._attach(start):
+            if node not in cost_so_far or distance < cost_so_far[node]:
+                cost_so_far[node], came_from[node] = distance, None
+                heapq.heappush(frontier, (distance + self.heuristic(node, end), node))
+        best_end, best_cost = None, None
+        while frontier:
+            priority, current = heapq.heappop(frontier)
+            if best_cost is not None and priority >= best_cost: break
+            if current in end_links:
+                total = cost_so_far[current] + end_links[current]
+                if best_cost is None or total < best_cost:
+                    best_end, best_cost = current, total
+            for next_node, distance in self.graph[current]:
+                new_cost = cost_so_far[current] + distance
+                if next_node not in cost_so_far or new_cost < cost_so_far[next_node]:
+                    cost_so_far[next_node], came_from[next_node] = new_cost, current
+                    heapq.heappush(frontier, (new_cost + self.heuristic(next_node, end), next_node))
+        if best_end is None:
+            return None
+        route = [best_end]
+        while came_from[route[-1]] is not None:
+            route.append(came_from[route[-1]])
+        route.reverse()
+        return route
+
+    def _remove_loops(self, path):
+        """Cuts out any stretch where joined legs double back over the same tile."""
+        result, position_of = [], {}
+        for node in path:
+            if node in position_of:
+                cut = position_of[node] + 1
+                for removed in result[cut:]:
+                    del position_of[removed]
+                del result[cut:]
+            else:
+                position_of[node] = len(result)
+                result.append(node)
+        return result
+
+def create_pathfinder(game_map):
+    """Returns the pathfinder selected by settings.PATHFINDER for a map."""
+    if settings.PATHFINDER == 'jps':
+        return JumpPointSearch(game_map)
+    if settings.PATHFINDER == 'hierarchical':
+        return HierarchicalPathfinder(game_map)
+    return AStar(game_map)
+
+class FlowFields:
+    """
+    Reverse searches ("flow fields") from shared destinations.
+    One breadth-first search from a destination gives every tile's distance to it, so each unit
+    heading there finds its next step by walking down the field, in time linear in the path length,
+    and only runs A* when occupied tiles block every shortest route. Fields are built from the
+    static passability grid, so they stay valid for the life of the map; occupied tiles are only
+    checked when a step is read. Steps are cached until the occupancy changes, and a unit found
+    walled in stays so without another search until one of the tiles walling it in is vacated.
+    The least recently used fields are dropped beyond settings.FLOW_FIELD_CACHE_SIZE.
+    """
+    def __init__(self, astar):
+        self.astar = astar
+        self.fields = collections.OrderedDict()
+        self.builds = 0
+        self.steps = {} # (start, destination) -> next step, for the occupancy in steps_version
+        self.steps_version = None
+        self.occupied = set() # Nodes of the occupied tiles in steps_version
+        self.dead_ends = {} # destination -> {start walled in by occupied tiles: those occupied tiles}
+
+    def get_field(self, destination):
+        """Returns the distance field for a destination, building it if it isn't cached."""
+        field = self.fields.get(destination)
+        if field is not None:
+            self.fields.move_to_end(destination)
+            return field
+        field = self._build_field(destination)
+        self.fields[destination] = field
+        if len(self.fields) > settings.FLOW_FIELD_CACHE_SIZE:
+            dropped, _ = self.fields.popitem(last=False)
+            self.dead_ends.pop(dropped, None)
+        return field
+
+    def _build_field(self, destination):
+        """Breadth-first search out from the destination; unreachable nodes keep a distance of -1."""
+        self.builds += 1
+        passable, neighbor_steps = self.astar.passable, self.astar.neighbor_steps
+        field = [-1] * len(passable)
+        goal = self.astar.index(*destination)
+        if not passable[goal]:
+            return field
+        field[goal] = 0
+        frontier, distance = [goal], 0
+        while frontier:
+            distance += 1
+            next_frontier = []
+            for node in frontier:
+                for step in neighbor_steps:
+                    next_node = node + step
+                    if passable[next_node] and field[next_node] < 0:
+                        field[next_node] = distance
+                        next_frontier.append(next_node)
+            frontier = next_frontier
+        return field
+
+    def next_step(self, start, destination, occupied_nodes, occupancy_version=None):
+        """
+        Returns the tile a unit at start should step onto to get closer to destination, or None.
+        The field is followed all the way to the destination; if every shortest route runs into an
+        occupied tile, the step comes from A* around the occupied tiles instead. Checking the whole
+        route keeps a unit on its detour, rather than stepping back towards the blockage it went around.
+        Pass occupancy_version, e.g. SpatialIndex.version, to cache the step until the occupancy changes.
+        """
+        if start == destination or destination in occupied_nodes or not self.astar.game_map.is_in_bounds(*destination):
+            return None
+        field = self.get_field(destination)
+        node = self.astar.index(*start)
+        distance = field[node]
+        if distance < 0 and self.astar.passable[node]:
+            return None # Destination can't be reached from here
+        if occupancy_version is None:
+            occupied = {self.astar.index(x, y) for x, y in occupied_nodes}
+        else:
+            if occupancy_version != self.steps_version:
+                self.steps.clear()
+                self.steps_version = occupancy_version
+                self.occupied = {self.astar.index(x, y) for x, y in occupied_nodes}
+            elif (start, destination) in self.steps:
+                return self.steps[(start, destination)]
+            occupied = self.occupied
+        walls = self.dead_ends.get(destination, {}).get(start)
+        if walls is not None and all(pos in occupied_nodes for pos in walls):
+            next_pos = None # Still walled in: the tiles that were free then can reach no further
+        else:
+            next_pos = self._follow_field(field, node, occupied)
+            if next_pos is None:
+                path = self.astar.find_path(start, destination, occupied_nodes)
+                if len(path) > 1:
+                    next_pos = path[1]
+                else:
+                    self.dead_ends.setdefault(destination, {})[start] = self._occupied_walls(node, occupied)
+        if occupancy_version is not None:
+            self.steps[(start, destination)] = next_pos
+        return next_pos
+
+    def _occupied_walls(self, node, occupied):
+        """Returns the occupied tiles bordering the free tiles reachable from node, which wall it in while they stay occupied."""
+        passable, neighbor_steps = self.astar.passable, self.astar.neighbor_steps
+        seen, frontier, walls = {node}, [node], []
+        while frontier:
+            current = frontier.pop()
+            for step in neighbor_steps:
+                next_node = current + step
+                if next_node in seen or not passable[next_node]: continue
+                seen.add(next_node)
+                if next_node in occupied:
+                    walls.append(self.astar.coords(next_node))
+                else:
+                    frontier.append(next_node)
+        return walls
+
+    def _follow_field(self, field, node, occupied):
+        """
+        Walks down the field from node, taking the first step off the occupied nodes each time.
+        Returns the first step's tile, or None if the walk gets stuck.
+        """
+        first_node, distance = None, field[node]
+        while distance > 0:
+            distance -= 1
+            for step in self.astar.neighbor_steps:
+                if field[node + step] == distance and node + step not in occupied:
+                    node += step
+                    break
+            else:
+                return None
+            if first_node is None: first_node = node
+        return None if first_node is None else self.astar.coords(first_node)
@@ -0,0 +1,147 @@
+import collections
+import math
+import pygame
+import numpy
+import settings
+
+# Rendered text surfaces keyed on (font, text, color, antialias), least recently used first
+text_cache = collections.OrderedDict()
+text_cache_stats = {'hits': 0, 'misses': 0}
+
+def render_text(font, text, color, antialias=True):
+    """
+    Returns font.render(text, antialias, color), reusing the surface from an earlier call when possible.
+    The surface is shared, so callers that change it (e.g. set_alpha) must copy it first.
+    """
+    key = (font, text, color, antialias)
+    surface = text_cache.get(key)
+    if surface is not None:
+        text_cache.move_to_end(key)
+        text_cache_stats['hits'] += 1
+        return surface
+    text_cache_stats['misses'] += 1
+    surface = text_cache[key] = font.render(text, antialias, color)
+    if len(text_cache) > settings.TEXT_CACHE_SIZE:
+        text_cache.popitem(last=False)
+    return surface
+
+class MapRenderer:
+    """
+    Draws a GameMap. Tiles are pre-drawn onto chunk surfaces and only redrawn when their
+    state changes, so a frame is one blit per chunk under the camera.
+    """
+    def __init__(self, game_map):
+        self.game_map = game_map
+        self.chunk_surfaces = {}
+        self.drawn_state = numpy.zeros((game_map.width, game_map.height), dtype=numpy.int8) # State code each tile was drawn with
+        self.tiles_redrawn = 0
+
+    def draw(self, surface, camera):
+        """Draws the visible and explored parts of the map."""
+        self.update_chunks()
+        chunk_size = settings.MAP_CHUNK_SIZE
+        chunk_pixels = chunk_size * settings.TILE_SIZE
+        min_x, min_y, max_x, max_y = (int(bound) for bound in camera.visible_tile_range())
+        blitted = 0
+        for cx in range(min_x // chunk_size, max_x // chunk_size + 1):
+            for cy in range(min_y // chunk_size, max_y // chunk_size + 1):
+                chunk = self.chunk_surfaces.get((cx, cy))
+                if chunk:
+                    surface.blit(chunk, (cx * chunk_pixels - camera.x, cy * chunk_pixels - camera.y))
+                    blitted += 1
+        camera.draw_calls_culled += len(self.chunk_surfaces) - blitted
+
+    def update_chunks(self):
+        """
+        Redraws the tiles whose state code (0 unexplored, 1 explored, 2 visible) changed since the last frame.
+        Returns the x and y arrays of the redrawn tiles.
+        """
+        game_map = self.game_map
+        state = game_map.is_explored.astype(numpy.int8)
+        state[game_map.is_visible] = 2
+        changed_x, changed_y = numpy.nonzero(state != self.drawn_state)
+        if not len(changed_x): return changed_x, changed_y
+        chunk_size = settings.MAP_CHUNK_SIZE
+        for x, y in zip(changed_x.tolist(), changed_y.tolist()):
+            key = (x // chunk_size, y // chunk_size)
+            chunk = self.chunk_surfaces.get(key)
+            if chunk is None:
+                chunk = self.chunk_surfaces[key] = pygame.Surface((chunk_size * settings.TILE_SIZE, chunk_size * settings.TILE_SIZE))
+            self._draw_tile(chunk, (x % chunk_size) * settings.TILE_SIZE, (y % chunk_size) * settings.TILE_SIZE, x, y, state[x, y])
+        self.tiles_redrawn += len(changed_x)
+        self.drawn_state = state
+        return changed_x, changed_y
+
+    def _draw_tile(self, surface, pos_x, pos_y, x, y, state):
+        """Draws tile (x, y) in the given state code at (pos_x, pos_y) on surface."""
+        rect = pygame.Rect(pos_x, pos_y, settings.TILE_SIZE, settings.TILE_SIZE)
+        if state == 0:
+            pygame.draw.rect(surface, settings.COLOR_BLACK, rect)
+            return
+        is_wall, is_cover = self.game_map.is_wall[x, y], self.game_map.is_cover[x, y]
+        if state == 2:
+            color = settings.COLOR_WALL if is_wall else settings.COLOR_FLOOR_VISIBLE
+            if is_cover:
+               color = settings.COLOR_COVER
+        else:
+            color = settings.COLOR_WALL if is_wall else settings.COLOR_FLOOR_EXPLORED
+            if is_cover:
+               color = settings.COLOR_DARK_GRAY
+
+        pygame.draw.rect(surface, color, rect)
+        if is_cover: # Draw a smaller rect to indicate cover
+            cover_rect = pygame.Rect(pos_x + 5, pos_y + 5, settings.TILE_SIZE - 10, settings.TILE_SIZE - 10)
+            pygame.draw.rect(surface, settings.COLOR_GRAY, cover_rect, 3)
+
+def selection_ring_width(game_time):
+    """Line width of the pulsing ring around the selected unit."""
+    pulse = 1 + abs(math.sin(game_time * 0.005) * 2)
+    return int(pulse) + 1
+
+def unit_appearance(unit, game_time):
+    """Everything draw_unit depends on besides position; the drawing only changes when this does."""
+    return (unit.is_alive and bool(unit.game_map.is_visible[unit.x, unit.y]), unit.team, unit.posture, unit.hp, unit.number,
+            unit.is_on_overwatch, unit.is_selected and selection_ring_width(game_time))
+
+def draw_unit(surface, unit, camera, font, game_time):
+    """Draws a unit on the main game surface."""
+    if not unit.is_alive or not unit.game_map.is_visible[unit.x, unit.y]:
+        return
+
+    pos_x, pos_y = camera.apply_coords(unit.x, unit.y)
+    center = (pos_x + settings.TILE_SIZE // 2, pos_y + settings.TILE_SIZE // 2)
+
+    if unit.is_on_overwatch:
+         pygame.draw.circle(surface, settings.COLOR_OVERWATCH, center, settings.UNIT_RADIUS + 6, 3)
+
+    if unit.is_selected:
+        pygame.draw.circle(surface, settings.COLOR_LASER, center, settings.UNIT_RADIUS + 3, selection_ring_width(game_time))
+
+    color = settings.COLOR_PLAYER if unit.team == 'player' else settings.COLOR_ENEMY
+
+    # Draw based on posture
+    if unit.posture == 'standing':
+        pygame.draw.circle(surface, color, center, settings.UNIT_RADIUS)
+    else: # Prone
+        prone_rect = pygame.Rect(center[0] - settings.UNIT_RADIUS, center[1] - settings.UNIT_RADIUS // 2, settings.UNIT_RADIUS * 2, settings.UNIT_RADIUS)
+        pygame.draw.ellipse(surface, color, prone_rect)
+
+    if unit.number is not None:
+        num_text = render_text(font, str(unit.number), settings.COLOR_WHITE)
+        num_rect = num_text.get_rect(center=center)
+        surface.blit(num_text, num_rect)
+
+    hp_rect_bg = pygame.Rect(pos_x, pos_y + settings.TILE_SIZE - 8, settings.TILE_SIZE, 6)
+    hp_percent = max(0, unit.hp / settings.UNIT_MAX_HP)
+    hp_rect_fg = pygame.Rect(pos_x, pos_y + settings.TILE_SIZE - 8, settings.TILE_SIZE * hp_percent, 6)
+    pygame.draw.rect(surface, settings.COLOR_DARK_GRAY, hp_rect_bg)
+    pygame.draw.rect(surface, settings.COLOR_PLAYER_LIGHT if unit.team == 'player' else settings.COLOR_ENEMY_LIGHT, hp_rect_fg)
+
+def draw_path(surface, unit, camera):
+    """Draws a unit's intended movement path."""
+    if unit.path and len(unit.path) > 1:
+        points = []
+        for node in unit.path:
+            pos_x, pos_y = camera.apply_coords(node[0], node[1])
+            points.append((pos_x + settings.TILE_SIZE // 2, pos_y + settings.TILE_SIZE // 2))
+        pygame.draw.lines(surface, settings.COLOR_PLAYER_LIGHT, False, points, 2)
@@ -40,11 +40,27 @@ SQUAD_SIZE = 4
 UNIT_MAX_HP = 100
 UNIT_MAX_AP = 10
 UNIT_VISION_RADIUS = 8
+FOV_ALGORITHM = 'raycast' # 'raycast' (per-tile line of sight) or 'shadowcast' (faster, but can hide tiles with a clear shot; see bench_fov.py)
+LOS_TABLE_RANGE = 20 # Line-of-sight rays up to this many tiles away are precomputed
 MOVE_COST = 1
 SHOOT_COST = 5
 LASER_DAMAGE = 35
 OVERWATCH_COST = 3
 CAMERA_SCROLL_SPEED = 15
+MAP_CHUNK_SIZE = 16 # Tiles per side of each pre-rendered map chunk
+MAP_TILES_PER_ROOM_ATTEMPT = 64 # Map generation tries one room per this many tiles (at least 30)
+TEXT_CACHE_SIZE = 256 # Rendered text surfaces kept by ui.render_text
+SOUND_CACHE_DIR = '.sound_cache' # Synthesized sound effects are cached here, next to sounds.py; None turns the cache off
+MATCH_MAX_TURNS = 50 # Headless AI-vs-AI matches (Engine.run_match) are a draw after this many turns
+DISPLAY_UPDATES = 'dirty' # 'dirty' (redraw and update only changed screen regions) or 'flip' (whole screen every frame)
+PATHFINDER = 'astar' # 'astar', 'jps' (Jump Point Search) or 'hierarchical' (room graph, then local A*)
+HIERARCHICAL_MIN_DISTANCE = 24 # Shorter searches skip the room graph
+HIERARCHICAL_LEG_LENGTH = 12 # Minimum distance between the waypoints joined by local searches
+FLOW_FIELD_CACHE_SIZE = 32 # Destinations whose flow fields are kept for the AI
+AI_FRAME_BUDGET_MS = 8 # Time the enemy turn may spend on AI actions each frame
+AI_VISIBLE_ACTION_DELAY_MS = 100 # Pause after an enemy action the player can see
+AI_PLANNING_THREAD = True # Plan enemy turns on a worker thread; False plans them on the main thread
+SPATIAL_CELL_SIZE = 8 # Tiles per side of the cells SpatialIndex groups units in for radius queries
 
 # --- New Settings ---
 PHONETIC_ALPHABET = ["Alpha", "Bravo", "Charlie", "Delta"]
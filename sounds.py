@@ -1,9 +1,18 @@
-import pygame
+import hashlib
+import os
+import sys
 import numpy
+import settings
 
-def generate_sound(frequency, duration, attack_time=0.01, decay_time=0.1, sound_type='sine'):
-    """Generates a pygame sound object with an ADSR-like envelope."""
-    sample_rate = 44100
+# Set to False to make play() a no-op that never synthesizes anything, e.g. for headless simulations
+enabled = True
+
+SAMPLE_RATE = 44100 # Must match the mixer's rate, set in main.py
+CACHE_VERSION = 1 # Part of every cache key; bump it when synthesize_wave changes, so stale waveforms aren't reused
+
+def synthesize_wave(frequency, duration, attack_time=0.01, decay_time=0.1, sound_type='sine', seed=0):
+    """Returns a stereo int16 waveform with an ADSR-like envelope. Noise is drawn from a generator seeded with seed."""
+    sample_rate = SAMPLE_RATE
     num_samples = int(sample_rate * duration)
     t = numpy.linspace(0, duration, num_samples, False)
 
@@ -13,7 +22,7 @@ def generate_sound(frequency, duration, attack_time=0.01, decay_time=0.1, sound_
     elif sound_type == 'square':
         wave = numpy.sign(numpy.sin(frequency * t * 2 * numpy.pi))
     elif sound_type == 'noise':
-        wave = numpy.random.uniform(-1, 1, num_samples)
+        wave = numpy.random.default_rng(seed).uniform(-1, 1, num_samples)
     else: # Sawtooth
         wave = 2 * (t * frequency - numpy.floor(0.5 + t * frequency))
 
@@ -38,15 +47,55 @@ def generate_sound(frequency, duration, attack_time=0.01, decay_time=0.1, sound_
     stereo_wave = numpy.array([wave, wave]).T
     
     # Ensure the array is C-contiguous
-    stereo_wave_contiguous = numpy.ascontiguousarray(stereo_wave)
-    return pygame.sndarray.make_sound(stereo_wave_contiguous)
+    return numpy.ascontiguousarray(stereo_wave)
 
 
-# --- Create Sound Effects ---
-SOUNDS = {
-    'laser': generate_sound(1200, 0.2, decay_time=0.2, sound_type='sawtooth'),
-    'hit': generate_sound(400, 0.3, decay_time=0.3, sound_type='noise'),
-    'death': generate_sound(200, 0.8, decay_time=0.8, sound_type='noise'),
-    'move': generate_sound(800, 0.05, decay_time=0.05, sound_type='square')
+# --- Sound Effects ---
+# name -> (synthesize_wave arguments, volume). Each is made on its first play(), so importing
+# this module needs neither pygame nor a mixer, and nothing is synthesized while sound is off.
+SOUND_EFFECTS = {
+    'laser': ({'frequency': 1200, 'duration': 0.2, 'decay_time': 0.2, 'sound_type': 'sawtooth'}, 1.0),
+    'hit': ({'frequency': 400, 'duration': 0.3, 'decay_time': 0.3, 'sound_type': 'noise'}, 1.0),
+    'death': ({'frequency': 200, 'duration': 0.8, 'decay_time': 0.8, 'sound_type': 'noise'}, 1.0),
+    'move': ({'frequency': 800, 'duration': 0.05, 'decay_time': 0.05, 'sound_type': 'square'}, 0.5),
 }
-SOUNDS['move'].set_volume(0.5)
+SOUNDS = {}
+
+def cache_path(params):
+    """Returns the file the waveform for the synthesize_wave arguments params is cached in, named by their hash."""
+    key = repr((CACHE_VERSION, SAMPLE_RATE, sorted(params.items())))
+    file_name = hashlib.sha1(key.encode()).hexdigest()[:16] + '.raw'
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), settings.SOUND_CACHE_DIR, file_name)
+
+def load_wave(params):
+    """
+    Returns the waveform for the synthesize_wave arguments params, read in one go from the disk cache
+    if it is there, else synthesized and written to the cache as raw interleaved int16 samples.
+    """
+    if settings.SOUND_CACHE_DIR is None: return synthesize_wave(**params)
+    path = cache_path(params)
+    try:
+        return numpy.fromfile(path, dtype=numpy.int16).reshape(-1, 2)
+    except (OSError, ValueError):
+        pass # Not cached yet, or unreadable
+    wave = synthesize_wave(**params)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        wave.tofile(temp_path)
+        os.replace(temp_path, path) # Readers never see a partly written file
+    except OSError:
+        pass # E.g. a read-only install, which just synthesizes every time
+    return wave
+
+def play(name):
+    """Plays a sound effect. Does nothing if sound is disabled or the pygame mixer isn't running."""
+    if not enabled: return
+    sound = SOUNDS.get(name)
+    if sound is None:
+        pygame = sys.modules.get('pygame') # No mixer can be running if nothing has imported pygame
+        if pygame is None or not pygame.mixer.get_init(): return
+        params, volume = SOUND_EFFECTS[name]
+        sound = SOUNDS[name] = pygame.sndarray.make_sound(load_wave(params))
+        sound.set_volume(volume)
+    sound.play()
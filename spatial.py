@@ -0,0 +1,152 @@
+import collections
+import itertools
+import math
+import settings
+
+_versions = itertools.count(1) # Shared by every index, so no two occupancy states share a version
+
+class SpatialIndex:
+    """
+    Where the living units on a map stand. Units are kept in a dict by tile, for "who is at (x, y)",
+    and in square cells of settings.SPATIAL_CELL_SIZE tiles, so a radius query only looks at the
+    units in nearby cells. Each team's living units are also kept as a list that is only rebuilt
+    after a unit joins or dies. on_tile_changed(x, y), if given, is called whenever the units on a tile change,
+    and version changes with them, so results worked out from the occupied tiles can be cached against it.
+    """
+    def __init__(self, on_tile_changed=None):
+        self.on_tile_changed = on_tile_changed
+        self.tiles = {} # (x, y) -> living units on that tile, last arrived last; the keys are the occupied tiles
+        self.cells = collections.defaultdict(list) # (cell x, cell y) -> living units in that cell
+        self.teams = collections.defaultdict(list) # team -> every unit added, alive or not, in order
+        self.alive_views = {} # team -> cached list of its living units
+        self.version = next(_versions)
+
+    def add(self, unit):
+        """Adds a new unit at its position."""
+        self.teams[unit.team].append(unit)
+        self.alive_views.pop(unit.team, None)
+        if unit.is_alive:
+            self._place(unit)
+
+    def move(self, unit, x, y):
+        """Moves a unit to (x, y)."""
+        if unit.is_alive:
+            self._lift(unit)
+        unit.x, unit.y = x, y
+        if unit.is_alive:
+            self._place(unit)
+
+    def remove(self, unit):
+        """Takes a unit that has died off the map."""
+        self._lift(unit)
+        self.alive_views.pop(unit.team, None)
+
+    def _place(self, unit):
+        pos = (unit.x, unit.y)
+        occupants = self.tiles.get(pos)
+        if occupants is None:
+            self.tiles[pos] = [unit]
+        else:
+            occupants.append(unit) # A player can walk onto a tile held by an unseen enemy
+        self.cells[self._cell(unit.x, unit.y)].append(unit)
+        self.version = next(_versions)
+        if self.on_tile_changed: self.on_tile_changed(*pos)
+
+    def _lift(self, unit):
+        pos = (unit.x, unit.y)
+        occupants = self.tiles.get(pos)
+        if occupants and unit in occupants:
+            occupants.remove(unit)
+            if not occupants:
+                del self.tiles[pos]
+            self.cells[self._cell(unit.x, unit.y)].remove(unit)
+            self.version = next(_versions)
+            if self.on_tile_changed: self.on_tile_changed(*pos)
+
+    def _cell(self, x, y):
+        return x // settings.SPATIAL_CELL_SIZE, y // settings.SPATIAL_CELL_SIZE
+
+    def units_at(self, x, y):
+        """Returns the living units on tile (x, y), usually none or one."""
+        return self.tiles.get((x, y), ())
+
+    def unit_at(self, x, y, team=None):
+        """Returns a living unit on tile (x, y), of the given team if there is one, or None."""
+        for unit in self.tiles.get((x, y), ()):
+            if team is None or unit.team == team: return unit
+        return None
+
+    def units_within(self, x, y, radius, team=None):
+        """Returns the living units within radius tiles of (x, y), of the given team if there is one."""
+        min_cx, min_cy = self._cell(math.floor(x - radius), math.floor(y - radius))
+        max_cx, max_cy = self._cell(math.ceil(x + radius), math.ceil(y + radius))
+        found = []
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                for unit in self.cells.get((cx, cy), ()):
+                    if (team is None or unit.team == team) and math.dist((x, y), (unit.x, unit.y)) <= radius:
+                        found.append(unit)
+        return found
+
+    def alive(self, team):
+        """Returns the team's living units, in the order they were added. The list is shared, so don't change it."""
+        view = self.alive_views.get(team)
+        if view is None:
+            view = self.alive_views[team] = [unit for unit in self.teams[team] if unit.is_alive]
+        return view
+
+class OverwatchIndex:
+    """
+    The units on overwatch, by team, each with a cache of the tiles it has a clear shot at.
+    A cached shot is dropped when a unit steps onto, leaves or changes posture on any tile of its
+    line, found through a reverse index from tiles to the shots passing them. The whole cache is
+    dropped when the overwatcher itself moves or changes posture.
+    """
+    def __init__(self, game_map):
+        self.game_map = game_map
+        self.watchers = collections.defaultdict(dict) # team -> {unit on overwatch: ShotCache or None}, in squad order
+
+    def set_watching(self, unit, watching):
+        """Adds a unit to, or removes it from, the units on overwatch."""
+        watchers = self.watchers[unit.team]
+        if not watching:
+            watchers.pop(unit, None)
+        elif unit not in watchers:
+            # Keep squad order, so reaction fire resolves in the same order whenever units went on overwatch
+            watchers[unit] = None
+            self.watchers[unit.team] = {u: watchers[u] for u in self.game_map.unit_index.teams[unit.team] if u in watchers}
+
+    def watchers_against(self, team):
+        """Returns the units of other teams on overwatch, as a new list."""
+        return [unit for other_team, watchers in self.watchers.items() if other_team != team for unit in watchers]
+
+    def has_clear_shot(self, unit, target_pos):
+        """True if the overwatching unit's line of sight reaches target_pos, as get_line_of_sight would find."""
+        watchers = self.watchers[unit.team]
+        cache = watchers[unit]
+        if cache is None or cache.key != (unit.x, unit.y, unit.posture):
+            cache = watchers[unit] = ShotCache((unit.x, unit.y, unit.posture))
+        clear = cache.clear.get(target_pos)
+        if clear is None:
+            line = self.game_map.get_line_of_sight(unit, target_pos)
+            clear = cache.clear[target_pos] = bool(line) and line[-1] == target_pos
+            for tile in line[:-1] if clear else line: # Who stands on the target tile doesn't matter
+                cache.shots_through[tile].append(target_pos)
+        return clear
+
+    def tile_changed(self, x, y):
+        """Drops the cached shots whose line passes (x, y), after the units there changed."""
+        for watchers in self.watchers.values():
+            for cache in watchers.values():
+                if cache is not None:
+                    for target_pos in cache.shots_through.pop((x, y), ()):
+                        cache.clear.pop(target_pos, None)
+
+class ShotCache:
+    """The shots one overwatching unit has checked from its position and posture in key."""
+    __slots__ = ('key', 'clear', 'shots_through')
+
+    def __init__(self, key):
+        self.key = key
+        self.clear = {} # target tile -> whether the shot is clear
+        self.shots_through = collections.defaultdict(list) # tile -> target tiles whose line passes it
@@ -1,20 +1,33 @@
-import pygame
 import settings
 import sounds
-import math
+
+def _tile_flag(name):
+    """Builds a property that reads and writes one of the GameMap's tile arrays."""
+    def getter(self):
+        return bool(getattr(self.game_map, name)[self.x, self.y])
+    def setter(self, value):
+        getattr(self.game_map, name)[self.x, self.y] = value
+    return property(getter, setter)
 
 class Tile:
-    """Represents a single tile on the map."""
-    def __init__(self, x, y, is_wall=False, is_cover=False):
+    """A view onto a single tile of a GameMap, backed by the map's tile arrays."""
+    __slots__ = ('game_map', 'x', 'y')
+    is_wall = _tile_flag('is_wall')
+    is_cover = _tile_flag('is_cover') # Low wall or object
+    is_visible = _tile_flag('is_visible')
+    is_explored = _tile_flag('is_explored')
+
+    def __init__(self, game_map, x, y):
+        self.game_map = game_map
         self.x = x
         self.y = y
-        self.is_wall = is_wall
-        self.is_cover = is_cover # Low wall or object
-        self.is_visible = False
-        self.is_explored = False
 
 class Unit:
     """Represents a player or enemy unit."""
+    # No per-unit __dict__: a unit is about half the size, and attribute reads skip a dict lookup
+    __slots__ = ('x', 'y', 'team', 'hp', 'ap', 'is_selected', 'is_alive', 'game_map', 'path', '_is_on_overwatch',
+                 'has_fired_overwatch', 'name', 'number', 'posture', 'distance_travelled', 'shots_taken', 'shots_hit',
+                 'kills', 'heals_given', 'ranged_skill', 'melee_skill')
     def __init__(self, x, y, team, game_map, name=None, number=None):
         self.x = x
         self.y = y
@@ -44,58 +57,32 @@ class Unit:
         else:
             self.ranged_skill = settings.ENEMY_RANGED_SKILL
             self.melee_skill = settings.ENEMY_MELEE_SKILL
+        self.game_map.unit_index.add(self)
+
+    def set_position(self, x, y):
+        """Moves the unit to (x, y), keeping the map's unit index up to date."""
+        self.game_map.unit_index.move(self, x, y)
 
     def change_posture(self):
-        """Toggles the unit's posture between standing and prone."""
+        """Toggles the unit's posture between standing and prone. Returns True if the unit had the AP to."""
         if self.ap >= settings.POSTURE_CHANGE_COST:
             self.ap -= settings.POSTURE_CHANGE_COST
             self.posture = 'prone' if self.posture == 'standing' else 'standing'
             # Changing posture cancels overwatch
             self.is_on_overwatch = False
+            self.game_map.overwatch.tile_changed(self.x, self.y) # A prone unit in cover can be shot over
+            return True
+        return False
 
-    def draw(self, surface, camera, font, game_time):
-        """Draws the unit on the main game surface."""
-        if not self.is_alive or not self.game_map.tiles[self.x][self.y].is_visible:
-            return
-
-        pos_x, pos_y = camera.apply_coords(self.x, self.y)
-        center = (pos_x + settings.TILE_SIZE // 2, pos_y + settings.TILE_SIZE // 2)
-        
-        if self.is_on_overwatch:
-             pygame.draw.circle(surface, settings.COLOR_OVERWATCH, center, settings.UNIT_RADIUS + 6, 3)
-
-        if self.is_selected:
-            pulse = 1 + abs(math.sin(game_time * 0.005) * 2)
-            pygame.draw.circle(surface, settings.COLOR_LASER, center, settings.UNIT_RADIUS + 3, int(pulse)+1)
-
-        color = settings.COLOR_PLAYER if self.team == 'player' else settings.COLOR_ENEMY
-        
-        # Draw based on posture
-        if self.posture == 'standing':
-            pygame.draw.circle(surface, color, center, settings.UNIT_RADIUS)
-        else: # Prone
-            prone_rect = pygame.Rect(center[0] - settings.UNIT_RADIUS, center[1] - settings.UNIT_RADIUS // 2, settings.UNIT_RADIUS * 2, settings.UNIT_RADIUS)
-            pygame.draw.ellipse(surface, color, prone_rect)
-        
-        if self.number is not None:
-            num_text = font.render(str(self.number), True, settings.COLOR_WHITE)
-            num_rect = num_text.get_rect(center=center)
-            surface.blit(num_text, num_rect)
-
-        hp_rect_bg = pygame.Rect(pos_x, pos_y + settings.TILE_SIZE - 8, settings.TILE_SIZE, 6)
-        hp_percent = max(0, self.hp / settings.UNIT_MAX_HP)
-        hp_rect_fg = pygame.Rect(pos_x, pos_y + settings.TILE_SIZE - 8, settings.TILE_SIZE * hp_percent, 6)
-        pygame.draw.rect(surface, settings.COLOR_DARK_GRAY, hp_rect_bg)
-        pygame.draw.rect(surface, settings.COLOR_PLAYER_LIGHT if self.team == 'player' else settings.COLOR_ENEMY_LIGHT, hp_rect_fg)
+    @property
+    def is_on_overwatch(self):
+        return self._is_on_overwatch
 
-    def draw_path(self, surface, camera):
-        """Draws the unit's intended movement path."""
-        if self.path and len(self.path) > 1:
-            points = []
-            for node in self.path:
-                pos_x, pos_y = camera.apply_coords(node[0], node[1])
-                points.append((pos_x + settings.TILE_SIZE // 2, pos_y + settings.TILE_SIZE // 2))
-            pygame.draw.lines(surface, settings.COLOR_PLAYER_LIGHT, False, points, 2)
+    @is_on_overwatch.setter
+    def is_on_overwatch(self, value):
+        """Sets the flag, keeping the map's overwatch index up to date."""
+        self._is_on_overwatch = value
+        self.game_map.overwatch.set_watching(self, value)
 
     def move_along_path(self):
         """Moves the unit one step along its path if it has AP."""
@@ -105,10 +92,10 @@ class Unit:
             self.posture = 'standing' # Moving forces unit to stand
 
             next_pos = self.path.pop(0)
-            self.x, self.y = next_pos
+            self.set_position(*next_pos)
             self.ap -= settings.MOVE_COST
             self.distance_travelled += 2
-            sounds.SOUNDS['move'].play()
+            sounds.play('move')
             return True
         self.path = []
         return False
@@ -116,7 +103,7 @@ class Unit:
     def take_damage(self, amount):
         """Applies damage and plays hit sound."""
         self.hp -= amount
-        sounds.SOUNDS['hit'].play()
+        sounds.play('hit')
         if self.hp <= 0:
             self.hp = 0
             self.die()
@@ -132,4 +119,7 @@ class Unit:
         if self.is_alive:
             self.is_alive = False
             self.is_selected = False
-            sounds.SOUNDS['death'].play()
+            self.is_on_overwatch = False
+            self.game_map.unit_index.remove(self)
+            if self.team == 'player': self.game_map.update_unit_fov(self) # Stop revealing what it saw
+            sounds.play('death')
@@ -1,9 +1,12 @@
 import pygame
+import numpy
 import settings
+import render
+from render import render_text
 
 def draw_home_screen(game):
     game.screen.fill(settings.COLOR_DARK_GRAY)
-    title_text = game.FONT_L.render("Tactical Squad Game", True, settings.COLOR_WHITE)
+    title_text = render_text(game.FONT_L, "Tactical Squad Game", settings.COLOR_WHITE)
     title_rect = title_text.get_rect(center=(settings.SCREEN_WIDTH / 2, settings.SCREEN_HEIGHT / 2 - 200))
     game.screen.blit(title_text, title_rect)
     instructions = ["INSTRUCTIONS", "", "Select Unit: Left-Click or Press Keys 1-4", "Move Unit: Right-Click on a valid floor tile",
@@ -11,36 +14,145 @@ def draw_home_screen(game):
                     "Posture: Press 'C' to toggle Stand/Prone (1 AP)", "Overwatch: Click button or Press 'O' (3 AP)", "End Turn: Click the End Turn button",
                     "Scroll Map: Arrow Keys or move mouse to screen edge", "Jump to Map Location: Click on the minimap", "", "Press any key to start..."]
     for i, line in enumerate(instructions):
-        line_text = game.FONT_M.render(line, True, settings.COLOR_WHITE)
+        line_text = render_text(game.FONT_M, line, settings.COLOR_WHITE)
         line_rect = line_text.get_rect(center=(settings.SCREEN_WIDTH / 2, settings.SCREEN_HEIGHT / 2 - 80 + i * 25))
         game.screen.blit(line_text, line_rect)
 
-def draw_game_world(game):
-    game.game_surface.fill(settings.COLOR_BLACK)
-    game_time = pygame.time.get_ticks()
-    game.game_map.draw(game.game_surface, game.camera)
+def tile_center(game, pos):
+    pos_x, pos_y = game.camera.apply_coords(pos[0], pos[1])
+    return pos_x + settings.TILE_SIZE // 2, pos_y + settings.TILE_SIZE // 2
+
+def world_sprites(game, game_time):
+    """
+    Returns (rect, key, draw, is_line) for every unit, path, laser and message in view, in drawing order.
+    rect bounds the drawing on game_surface, key changes whenever the drawing would, and draw() draws it.
+    Lines are flagged because pygame rounds their clipped end points, so they can only be redrawn whole.
+    """
+    surface, camera = game.game_surface, game.camera
+    sprites = []
     for unit in game.player_squad + game.all_enemies:
-        unit.draw(game.game_surface, game.camera, game.FONT_S, game_time)
-    if game.selected_unit: game.selected_unit.draw_path(game.game_surface, game.camera)
+        if unit.is_alive and camera.in_view(unit.x, unit.y, 1):
+            pos_x, pos_y = camera.apply_coords(unit.x, unit.y)
+            rect = pygame.Rect(pos_x - 2, pos_y - 2, settings.TILE_SIZE + 4, settings.TILE_SIZE + 4) # The overwatch ring overhangs the tile
+            sprites.append((rect, render.unit_appearance(unit, game_time), lambda unit=unit: render.draw_unit(surface, unit, camera, game.FONT_S, game_time), False))
+    unit = game.selected_unit
+    if unit and unit.path and len(unit.path) > 1:
+        points = [tile_center(game, node) for node in unit.path]
+        rect = pygame.Rect(points[0], (0, 0)).unionall([pygame.Rect(point, (0, 0)) for point in points]).inflate(6, 6)
+        sprites.append((rect, tuple(unit.path), lambda: render.draw_path(surface, unit, camera), True))
     for start, end, timer in game.laser_effects:
-        start_pos = game.camera.apply_coords(start[0], start[1]); end_pos = game.camera.apply_coords(end[0], end[1])
-        start_center = (start_pos[0] + settings.TILE_SIZE // 2, start_pos[1] + settings.TILE_SIZE // 2)
-        end_center = (end_pos[0] + settings.TILE_SIZE // 2, end_pos[1] + settings.TILE_SIZE // 2)
-        pygame.draw.line(game.game_surface, settings.COLOR_LASER, start_center, end_center, 3)
+        if not camera.box_in_view(min(start[0], end[0]), min(start[1], end[1]), max(start[0], end[0]), max(start[1], end[1])): continue
+        start_center, end_center = tile_center(game, start), tile_center(game, end)
+        rect = pygame.Rect(start_center, (0, 0)).union(pygame.Rect(end_center, (0, 0))).inflate(8, 8)
+        draw = lambda start_center=start_center, end_center=end_center: pygame.draw.line(surface, settings.COLOR_LASER, start_center, end_center, 3)
+        sprites.append((rect, ('laser', start, end), draw, True))
     for msg in game.skill_check_messages:
-        pos_x, pos_y = game.camera.apply_coords(msg['pos'][0], msg['pos'][1])
-        text = game.FONT_M.render(msg['text'], True, msg['color'])
+        if not camera.in_view(msg['pos'][0], msg['pos'][1], 2): continue # Text is wider than a tile
+        center_x, center_y = tile_center(game, msg['pos'])
+        text = render_text(game.FONT_M, msg['text'], msg['color']).copy() # set_alpha below would change the cached surface
         alpha = int(255 * (msg['timer'] / 60)); text.set_alpha(alpha)
-        text_rect = text.get_rect(center=(pos_x + settings.TILE_SIZE // 2, pos_y - 20))
-        game.game_surface.blit(text, text_rect)
+        text_rect = text.get_rect(center=(center_x, center_y - settings.TILE_SIZE // 2 - 20))
+        sprites.append((text_rect, (msg['text'], msg['color'], alpha), lambda text=text, text_rect=text_rect: surface.blit(text, text_rect), False))
+    return sprites
+
+def draw_game_world(game):
+    """Redraws the whole game screen. Returns the world sprites drawn."""
+    game.game_surface.fill(settings.COLOR_BLACK)
+    game_time = pygame.time.get_ticks()
+    game.camera.update_view()
+    game.map_renderer.draw(game.game_surface, game.camera)
+    sprites = world_sprites(game, game_time)
+    for rect, key, draw, is_line in sprites: draw()
     game.screen.blit(game.game_surface, (settings.SIDE_PANEL_WIDTH, 0))
     draw_squad_ui(game); draw_bottom_ui(game)
     if game.game_state == 'GAME_OVER': draw_game_over(game)
+    return sprites
+
+def squad_ui_key(game):
+    return tuple((u.number, u.name, u.hp, u.ap, u.is_selected, u.is_alive, u.is_on_overwatch, u.posture) for u in game.player_squad)
+
+def bottom_ui_key(game):
+    mouse_pos = pygame.mouse.get_pos()
+    buttons = (game.end_turn_button, game.overwatch_button, game.prone_button, game.heal_button)
+    hovered = next((i for i, button in enumerate(buttons) if button.collidepoint(mouse_pos)), None)
+    selected = game.selected_unit
+    selected_key = selected and (selected.ap, selected.posture, selected.is_on_overwatch)
+    return (game.turn_number, game.game_state, len(game.unit_index.alive('enemy')), hovered, selected_key, game.can_selected_unit_heal())
+
+def minimap_markers_key(game):
+    return tuple((u.x, u.y, u.team) for u in game.unit_index.alive('player') + game.unit_index.alive('enemy') if game.game_map.is_visible[u.x, u.y])
+
+def grow_to_lines(rect, line_rects):
+    """Grows rect until it contains every line it touches."""
+    grown = True
+    while grown:
+        grown = False
+        for line_rect in line_rects:
+            if line_rect.colliderect(rect) and not rect.contains(line_rect):
+                rect = rect.union(line_rect); grown = True
+    return rect
+
+def draw_frame(game):
+    """
+    Draws a frame for the 'dirty' display mode, redrawing only what changed since the last frame.
+    Returns the screen rects to pass to pygame.display.update, or None after a full redraw that needs a flip.
+    """
+    last_frame = game.last_frame
+    camera_pos = (game.camera.x, game.camera.y)
+    if last_frame is None or last_frame['game_state'] != game.game_state or last_frame['camera'] != camera_pos:
+        game.screen.fill(settings.COLOR_BLACK)
+        sprites = draw_home_screen(game) if game.game_state == 'HOME_SCREEN' else draw_game_world(game)
+        game.last_frame = {'game_state': game.game_state, 'camera': camera_pos,
+                           'sprites': {(tuple(rect), key) for rect, key, draw, is_line in sprites or ()},
+                           'squad_ui': squad_ui_key(game), 'bottom_ui': bottom_ui_key(game), 'minimap': minimap_markers_key(game)}
+        return None
+    if game.game_state in ('HOME_SCREEN', 'GAME_OVER'): return [] # Static screens
+
+    # World: tiles whose FOV state changed, plus sprites that appeared, disappeared or changed
+    game_time = pygame.time.get_ticks()
+    game.camera.update_view()
+    world_rects = []
+    changed_x, changed_y = game.map_renderer.update_chunks()
+    if len(changed_x):
+        min_x, min_y = game.camera.apply_coords(int(changed_x.min()), int(changed_y.min()))
+        max_x, max_y = game.camera.apply_coords(int(changed_x.max()) + 1, int(changed_y.max()) + 1)
+        world_rects.append(pygame.Rect(min_x, min_y, max_x - min_x, max_y - min_y))
+    sprites = world_sprites(game, game_time)
+    sprite_keys = {(tuple(rect), key) for rect, key, draw, is_line in sprites}
+    world_rects += [pygame.Rect(rect) for rect, key in sprite_keys ^ last_frame['sprites']]
+    line_rects = [rect for rect, key, draw, is_line in sprites if is_line]
+    surface_rect = game.game_surface.get_rect()
+    world_rects = [grow_to_lines(rect, line_rects).clip(surface_rect) for rect in world_rects if rect.colliderect(surface_rect)]
+    for rect in world_rects:
+        game.game_surface.set_clip(rect)
+        game.game_surface.fill(settings.COLOR_BLACK)
+        game.map_renderer.draw(game.game_surface, game.camera)
+        for sprite_rect, key, draw, is_line in sprites:
+            if sprite_rect.colliderect(rect): draw()
+    game.game_surface.set_clip(None)
+    dirty_rects = [rect.move(settings.SIDE_PANEL_WIDTH, 0) for rect in world_rects]
+    for rect in dirty_rects: game.screen.blit(game.game_surface, rect, rect.move(-settings.SIDE_PANEL_WIDTH, 0))
+
+    # Panels, redrawn when their contents change or the world was redrawn underneath them
+    squad_key, bottom_key, minimap_key = squad_ui_key(game), bottom_ui_key(game), minimap_markers_key(game)
+    ui_panel = pygame.Rect(0, settings.SCREEN_HEIGHT - 100, settings.SCREEN_WIDTH, 100)
+    redraw_squad_ui = squad_key != last_frame['squad_ui']
+    redraw_bottom_ui = redraw_squad_ui or bottom_key != last_frame['bottom_ui'] or ui_panel.collidelist(dirty_rects) != -1
+    redraw_minimap = (update_minimap_base(game) or minimap_key != last_frame['minimap'] or
+                      game.minimap_rect.collidelist(dirty_rects) != -1)
+    if redraw_squad_ui:
+        draw_squad_ui(game); dirty_rects.append(pygame.Rect(0, 0, settings.SIDE_PANEL_WIDTH, settings.SCREEN_HEIGHT))
+    if redraw_bottom_ui:
+        draw_bottom_ui(game); dirty_rects += [ui_panel, game.minimap_rect]
+    elif redraw_minimap:
+        draw_minimap(game); dirty_rects.append(game.minimap_rect)
+    last_frame.update(sprites=sprite_keys, squad_ui=squad_key, bottom_ui=bottom_key, minimap=minimap_key)
+    return dirty_rects
     
 def draw_game_over(game):
     overlay = pygame.Surface((settings.SCREEN_WIDTH, settings.SCREEN_HEIGHT), pygame.SRCALPHA)
     overlay.fill((0, 0, 0, 180));
-    text = game.FONT_L.render(game.game_over_message, True, settings.COLOR_WHITE)
+    text = render_text(game.FONT_L, game.game_over_message, settings.COLOR_WHITE)
     text_rect = text.get_rect(center=(settings.SCREEN_WIDTH/2, settings.SCREEN_HEIGHT/2 - 150))
     overlay.blit(text, text_rect)
     awards = []
@@ -61,15 +173,15 @@ def draw_game_over(game):
     if best_marksman: awards.append(f"Marksman: {best_marksman.name} ({best_accuracy:.0%})")
     y_offset = settings.SCREEN_HEIGHT/2 - 80
     if awards:
-        award_title_text = game.FONT_M.render("--- AWARDS ---", True, settings.COLOR_WHITE)
+        award_title_text = render_text(game.FONT_M, "--- AWARDS ---", settings.COLOR_WHITE)
         award_title_rect = award_title_text.get_rect(center=(settings.SCREEN_WIDTH/2, y_offset))
         overlay.blit(award_title_text, award_title_rect)
         y_offset += 40
         for i, award_str in enumerate(awards):
-            award_text = game.FONT_M.render(award_str, True, settings.COLOR_LASER)
+            award_text = render_text(game.FONT_M, award_str, settings.COLOR_LASER)
             award_rect = award_text.get_rect(center=(settings.SCREEN_WIDTH/2, y_offset + i * 30))
             overlay.blit(award_text, award_rect)
-    prompt_text = game.FONT_M.render("Press any key to return to the main menu.", True, settings.COLOR_WHITE)
+    prompt_text = render_text(game.FONT_M, "Press any key to return to the main menu.", settings.COLOR_WHITE)
     prompt_rect = prompt_text.get_rect(center=(settings.SCREEN_WIDTH/2, settings.SCREEN_HEIGHT - 150))
     overlay.blit(prompt_text, prompt_rect)
     game.screen.blit(overlay, (0,0))
@@ -85,11 +197,11 @@ def draw_squad_ui(game):
         box_color = (40, 40, 70) if unit.is_selected else settings.COLOR_DARK_GRAY
         pygame.draw.rect(game.screen, box_color, unit_box_rect, border_radius=5)
         pygame.draw.rect(game.screen, settings.COLOR_UI_BORDER, unit_box_rect, 1, border_radius=5)
-        name_text = game.FONT_M.render(f"{unit.number}. {unit.name}", True, settings.COLOR_WHITE)
+        name_text = render_text(game.FONT_M, f"{unit.number}. {unit.name}", settings.COLOR_WHITE)
         game.screen.blit(name_text, (20, start_y + 5))
-        hp_text = game.FONT_S.render(f"HP: {unit.hp}/{settings.UNIT_MAX_HP}", True, settings.COLOR_PLAYER_LIGHT)
+        hp_text = render_text(game.FONT_S, f"HP: {unit.hp}/{settings.UNIT_MAX_HP}", settings.COLOR_PLAYER_LIGHT)
         game.screen.blit(hp_text, (20, start_y + 30))
-        ap_text = game.FONT_S.render(f"AP: {unit.ap}/{settings.UNIT_MAX_AP}", True, settings.COLOR_PLAYER_LIGHT)
+        ap_text = render_text(game.FONT_S, f"AP: {unit.ap}/{settings.UNIT_MAX_AP}", settings.COLOR_PLAYER_LIGHT)
         game.screen.blit(ap_text, (120, start_y + 30))
 
         # --- NEW: AP Bar ---
@@ -105,36 +217,61 @@ def draw_squad_ui(game):
         pygame.draw.rect(game.screen, settings.COLOR_PLAYER_LIGHT, (ap_bar_x, ap_bar_y, current_ap_width, ap_bar_height))
         pygame.draw.rect(game.screen, settings.COLOR_UI_BORDER, (ap_bar_x, ap_bar_y, ap_bar_width, ap_bar_height), 1)
 
-        if not unit.is_alive: status_text = game.FONT_M.render("KIA", True, settings.COLOR_ENEMY)
-        elif unit.is_on_overwatch: status_text = game.FONT_M.render("Overwatch", True, settings.COLOR_OVERWATCH)
-        elif unit.posture == 'prone': status_text = game.FONT_M.render("Prone", True, settings.COLOR_GRAY)
+        if not unit.is_alive: status_text = render_text(game.FONT_M, "KIA", settings.COLOR_ENEMY)
+        elif unit.is_on_overwatch: status_text = render_text(game.FONT_M, "Overwatch", settings.COLOR_OVERWATCH)
+        elif unit.posture == 'prone': status_text = render_text(game.FONT_M, "Prone", settings.COLOR_GRAY)
         else: status_text = None
         if status_text: game.screen.blit(status_text, (20, start_y + 50))
         start_y += box_height + 10
 
+# Minimap tile codes index this palette: unexplored, wall, floor, visible cover, remembered cover
+MINIMAP_PALETTE = numpy.array([settings.COLOR_UI_BG, settings.COLOR_WALL, settings.COLOR_FLOOR_EXPLORED,
+                               settings.COLOR_GRAY, settings.COLOR_DARK_GRAY], dtype=numpy.uint8)
+
+def minimap_tile_codes(game_map):
+    """Returns the MINIMAP_PALETTE index of every map tile."""
+    codes = numpy.where(game_map.is_wall, 1, 2).astype(numpy.int8)
+    codes[game_map.is_cover & game_map.is_visible] = 3
+    codes[game_map.is_cover & ~game_map.is_visible] = 4
+    codes[~game_map.is_explored] = 0
+    return codes
+
+def update_minimap_base(game):
+    """
+    Writes the pixels of the tiles whose minimap code changed since the last call straight into the minimap surface.
+    Returns True if any changed.
+    """
+    codes = minimap_tile_codes(game.game_map)
+    if game.minimap_tile_codes is None: changed = numpy.ones(codes.shape, dtype=bool)
+    else: changed = codes != game.minimap_tile_codes
+    xs, ys = numpy.nonzero(changed)
+    if len(xs):
+        scale = numpy.arange(settings.MINIMAP_SCALE)
+        pixel_x = xs[:, None, None] * settings.MINIMAP_SCALE + scale[None, :, None]
+        pixel_y = ys[:, None, None] * settings.MINIMAP_SCALE + scale[None, None, :]
+        pixels = pygame.surfarray.pixels3d(game.minimap_surface)
+        pixels[pixel_x, pixel_y] = MINIMAP_PALETTE[codes[xs, ys]][:, None, None, :]
+        del pixels # Unlocks the surface
+    game.minimap_tile_codes = codes
+    return bool(len(xs))
+
 def draw_minimap(game):
-    game.minimap_surface.fill(settings.COLOR_UI_BG)
-    for x in range(game.game_map.width):
-        for y in range(game.game_map.height):
-            if game.game_map.tiles[x][y].is_explored:
-                color = settings.COLOR_WALL if game.game_map.tiles[x][y].is_wall else settings.COLOR_FLOOR_EXPLORED
-                if game.game_map.tiles[x][y].is_cover: color = settings.COLOR_GRAY if game.game_map.tiles[x][y].is_visible else settings.COLOR_DARK_GRAY
-                pygame.draw.rect(game.minimap_surface, color, (x*settings.MINIMAP_SCALE, y*settings.MINIMAP_SCALE, settings.MINIMAP_SCALE, settings.MINIMAP_SCALE))
+    update_minimap_base(game)
+    game.screen.blit(game.minimap_surface, game.minimap_rect)
     for unit in game.player_squad + game.all_enemies:
-        if unit.is_alive and game.game_map.tiles[unit.x][unit.y].is_visible:
+        if unit.is_alive and game.game_map.is_visible[unit.x, unit.y]:
             color = settings.COLOR_PLAYER_LIGHT if unit.team == 'player' else settings.COLOR_ENEMY_LIGHT
-            pygame.draw.rect(game.minimap_surface, color, (unit.x*settings.MINIMAP_SCALE, unit.y*settings.MINIMAP_SCALE, settings.MINIMAP_SCALE, settings.MINIMAP_SCALE))
-    pygame.draw.rect(game.minimap_surface, settings.COLOR_UI_BORDER, game.minimap_surface.get_rect(), 2)
-    game.screen.blit(game.minimap_surface, game.minimap_rect)
+            pygame.draw.rect(game.screen, color, (game.minimap_rect.x + unit.x*settings.MINIMAP_SCALE, game.minimap_rect.y + unit.y*settings.MINIMAP_SCALE, settings.MINIMAP_SCALE, settings.MINIMAP_SCALE))
+    pygame.draw.rect(game.screen, settings.COLOR_UI_BORDER, game.minimap_rect, 2)
 
 def draw_bottom_ui(game):
     ui_panel = pygame.Rect(0, settings.SCREEN_HEIGHT - 100, settings.SCREEN_WIDTH, 100)
     pygame.draw.rect(game.screen, settings.COLOR_UI_BG, ui_panel); pygame.draw.rect(game.screen, settings.COLOR_UI_BORDER, ui_panel, 2)
-    turn_text_str = f"Turn {game.turn_number}: {game.game_state.replace('_', ' ')}"; turn_text = game.FONT_M.render(turn_text_str, True, settings.COLOR_WHITE)
+    turn_text_str = f"Turn {game.turn_number}: {game.game_state.replace('_', ' ')}"; turn_text = render_text(game.FONT_M, turn_text_str, settings.COLOR_WHITE)
     game.screen.blit(turn_text, (settings.SIDE_PANEL_WIDTH + 20, settings.SCREEN_HEIGHT - 85))
     
-    enemies_left = len([u for u in game.all_enemies if u.is_alive])
-    enemy_text = game.FONT_M.render(f"Enemies Remaining: {enemies_left}", True, settings.COLOR_WHITE)
+    enemies_left = len(game.unit_index.alive('enemy'))
+    enemy_text = render_text(game.FONT_M, f"Enemies Remaining: {enemies_left}", settings.COLOR_WHITE)
     game.screen.blit(enemy_text, (settings.SIDE_PANEL_WIDTH + 20, settings.SCREEN_HEIGHT - 45))
 
     mouse_pos = pygame.mouse.get_pos()
@@ -142,7 +279,7 @@ def draw_bottom_ui(game):
     # End Turn Button
     button_color = settings.COLOR_BUTTON_HOVER if game.end_turn_button.collidepoint(mouse_pos) else settings.COLOR_BUTTON
     pygame.draw.rect(game.screen, button_color, game.end_turn_button, border_radius=5)
-    button_text = game.FONT_M.render("End Turn", True, settings.COLOR_BUTTON_TEXT)
+    button_text = render_text(game.FONT_M, "End Turn", settings.COLOR_BUTTON_TEXT)
     text_rect = button_text.get_rect(center=game.end_turn_button.center); game.screen.blit(button_text, text_rect)
     
     # Overwatch Button
@@ -150,7 +287,7 @@ def draw_bottom_ui(game):
     button_color = settings.COLOR_BUTTON_HOVER if game.overwatch_button.collidepoint(mouse_pos) and can_overwatch else settings.COLOR_BUTTON
     pygame.draw.rect(game.screen, button_color, game.overwatch_button, border_radius=5)
     text_color = settings.COLOR_BUTTON_TEXT if can_overwatch else settings.COLOR_GRAY
-    button_text = game.FONT_M.render("Overwatch", True, text_color)
+    button_text = render_text(game.FONT_M, "Overwatch", text_color)
     text_rect = button_text.get_rect(center=game.overwatch_button.center); game.screen.blit(button_text, text_rect)
     
     # Prone Button
@@ -159,7 +296,7 @@ def draw_bottom_ui(game):
     button_color = settings.COLOR_BUTTON_HOVER if game.prone_button.collidepoint(mouse_pos) and can_change_posture else settings.COLOR_BUTTON
     pygame.draw.rect(game.screen, button_color, game.prone_button, border_radius=5)
     text_color = settings.COLOR_BUTTON_TEXT if can_change_posture else settings.COLOR_GRAY
-    button_text = game.FONT_M.render(prone_text, True, text_color)
+    button_text = render_text(game.FONT_M, prone_text, text_color)
     text_rect = button_text.get_rect(center=game.prone_button.center); game.screen.blit(button_text, text_rect)
 
     # Heal Button
@@ -167,7 +304,7 @@ def draw_bottom_ui(game):
     button_color = settings.COLOR_BUTTON_HOVER if game.heal_button.collidepoint(mouse_pos) and can_heal else settings.COLOR_BUTTON
     pygame.draw.rect(game.screen, button_color, game.heal_button, border_radius=5)
     text_color = settings.COLOR_BUTTON_TEXT if can_heal else settings.COLOR_GRAY
-    button_text = game.FONT_M.render("Heal", True, text_color)
+    button_text = render_text(game.FONT_M, "Heal", text_color)
     text_rect = button_text.get_rect(center=game.heal_button.center); game.screen.blit(button_text, text_rect)
 
 